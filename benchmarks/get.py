@@ -0,0 +1,134 @@
+# coding: utf-8
+"""Benchmark of GET throughput for server that decodes values on SET and
+encodes them again on every GET (naive) and for server that keeps raw JSON
+of value and splices it into reply (spliced).
+
+Both servers are emulated with relay from test suite, so result includes
+client and server CPU time. Run it as::
+
+    $ python benchmarks/get.py --duration 2
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import json
+import time
+import struct
+import argparse
+
+import anyjson
+
+from speicher import Speicher
+from speicher.connection import LENGTH_FORMAT
+from speicher.tests.relay import FramedRelay
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def nested(depth, width):
+    """Create nested document with given depth and width."""
+    if depth == 0:
+        return ['value'] * width
+    return dict(('key{0}'.format(i), nested(depth - 1, width))
+                for i in range(width))
+
+
+#: Values with increasing size, from small string to ~1 MB document.
+VALUES = [
+    ('string', 'bar'),
+    ('1kb-list', list(range(200))),
+    ('16kb-dict', nested(2, 12)),
+    ('64kb-dict', nested(2, 19)),
+    ('1mb-nested', nested(3, 18)),
+]
+
+
+def raw_fields(payload):
+    """Yield key and raw JSON slice of each value of top-level object."""
+    decoder = json.JSONDecoder()
+    idx = WHITESPACE.match(payload, 1).end()
+    while payload[idx] != '}':
+        key, idx = json.decoder.scanstring(payload, idx + 1)
+        idx = WHITESPACE.match(payload, idx).end() + 1  # skip ':'
+        idx = WHITESPACE.match(payload, idx).end()
+        end = decoder.raw_decode(payload, idx)[1]
+        yield key, payload[idx:end]
+        idx = WHITESPACE.match(payload, end).end()
+        if payload[idx] == ',':
+            idx = WHITESPACE.match(payload, idx + 1).end()
+
+
+class NaiveServer(FramedRelay):
+    """Store decoded values, encode them on every GET."""
+
+    def __init__(self):
+        super(NaiveServer, self).__init__(self.handle)
+        self.store = {}
+
+    def handle(self, data):
+        if data['command'] == 'SET':
+            self.store[data['key']] = data['value']
+            return {'status_code': 200}
+        return {'status_code': 200, 'value': self.store[data['key']]}
+
+
+class SplicedServer(FramedRelay):
+    """Store raw JSON of values, splice them into GET reply."""
+
+    reply_prefix = b'{"status_code": 200, "value": '
+
+    def __init__(self):
+        super(SplicedServer, self).__init__()
+        self.store = {}
+
+    def _process(self, client, data):
+        packet = self._packets[client]
+        packet.feed(data)
+        for payload in packet.frames():
+            data = anyjson.deserialize(payload)
+            if data['command'] == 'SET':
+                value = dict(raw_fields(payload))['value']
+                self.store[data['key']] = value
+                client.write(self._encode({'status_code': 200}))
+            else:
+                value = self.store[data['key']]
+                reply = self.reply_prefix + value + b'}'
+                client.write(struct.pack(LENGTH_FORMAT, len(reply)) + reply)
+
+
+def measure(server, value, duration):
+    """Return GET requests per second for given server and value."""
+    server.start()
+    client = Speicher(host=server.host, port=server.port)
+    try:
+        client.set('foo', value)
+        count = 0
+        started = time.time()
+        deadline = started + duration
+        while time.time() < deadline:
+            client.get('foo')
+            count += 1
+        return count / (time.time() - started)
+    finally:
+        client.close()
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='seconds to run each case')
+    args = parser.parse_args()
+    print('{0:<12} {1:>10} {2:>12} {3:>12}'.format(
+        'value', 'size', 'naive, r/s', 'spliced, r/s'))
+    for name, value in VALUES:
+        size = len(anyjson.serialize(value))
+        naive = measure(NaiveServer(), value, args.duration)
+        spliced = measure(SplicedServer(), value, args.duration)
+        print('{0:<12} {1:>10} {2:>12.1f} {3:>12.1f}'.format(
+            name, size, naive, spliced))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# coding: utf-8
+"""Benchmark of GET tail latency with injected faults: some replies are
+delayed and some connections are dropped by relay from test suite.
+
+Compares client without any protection, client with deadline and retries,
+and client that also hedges slow requests. Run it as::
+
+    $ python benchmarks/latency.py --requests 5000 --delay 0.2 --delay-rate 0.01
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+import argparse
+
+from speicher import Speicher
+from speicher.exceptions import SpeicherError
+from speicher.tests.relay import FaultyRelay, random_fault
+from speicher.tests.store import Store
+
+CLIENTS = [
+    ('plain', dict(timeout=1.0), None),
+    ('retries', dict(timeout=1.0, retries=2), 0.5),
+    ('hedge', dict(timeout=1.0, retries=2, hedge=True), 0.5),
+]
+
+
+def percentile(values, percent):
+    index = min(int(len(values) * percent / 100.0), len(values) - 1)
+    return values[index]
+
+
+def measure(port, options, timeout, count):
+    """Return sorted GET latencies and number of failed GETs."""
+    client = Speicher(host='127.0.0.1', port=port, **options)
+    latencies = []
+    errors = 0
+    try:
+        for _ in range(count):
+            started = time.time()
+            try:
+                client.get('foo', timeout=timeout)
+            except SpeicherError:
+                errors += 1
+            latencies.append(time.time() - started)
+    finally:
+        client.close()
+    return sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='GETs per client')
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help='delay of slow reply in seconds')
+    parser.add_argument('--delay-rate', type=float, default=0.01,
+                        help='share of delayed replies')
+    parser.add_argument('--drop-rate', type=float, default=0.001,
+                        help='share of dropped connections')
+    args = parser.parse_args()
+    store = Store()
+    store.data['foo'] = 'bar'
+    relay = FaultyRelay(store, random_fault(
+        args.delay, args.delay_rate, args.drop_rate))
+    relay.start()
+    print('{0:<8} {1:>9} {2:>9} {3:>9} {4:>9} {5:>7}'.format(
+        'client', 'p50, ms', 'p99, ms', 'p999, ms', 'max, ms', 'errors'))
+    try:
+        for name, options, timeout in CLIENTS:
+            latencies, errors = measure(
+                relay.port, options, timeout, args.requests)
+            print('{0:<8} {1:>9.3f} {2:>9.3f} {3:>9.3f} {4:>9.3f} {5:>7}'
+                  .format(name, percentile(latencies, 50) * 1000,
+                          percentile(latencies, 99) * 1000,
+                          percentile(latencies, 99.9) * 1000,
+                          latencies[-1] * 1000, errors))
+    finally:
+        relay.stop()
+
+
+if __name__ == '__main__':
+    main()
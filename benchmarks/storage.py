@@ -0,0 +1,108 @@
+# coding: utf-8
+"""Benchmark of memory per key and operations per second of storage
+engines: dictionary of decoded values (objects), dictionary of encoded
+values (dict) and arena-based storage (compact).
+
+Every case is run in separate process to measure its memory. Run it as::
+
+    $ python benchmarks/storage.py --keys 1000000 10000000 50000000
+
+"""
+from __future__ import (
+    absolute_import, division, unicode_literals, print_function)
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import anyjson
+from six.moves import range
+
+from speicher.storage import DictStorage, CompactStorage
+
+
+class ObjectStorage(DictStorage):
+    """Keep decoded values, as naive server does."""
+
+    def set(self, key, value):
+        super(ObjectStorage, self).set(key, anyjson.deserialize(value))
+
+
+ENGINES = dict(
+    objects=ObjectStorage,
+    dict=DictStorage,
+    compact=CompactStorage,
+)
+
+#: How many keys read and delete to measure speed.
+SAMPLE_SIZE = 1000000
+
+
+def entry(i):
+    """Create key and small encoded JSON value."""
+    key = 'user:{0}'.format(i).encode('ascii')
+    value = anyjson.serialize(dict(id=i, name='user{0}'.format(i)))
+    return key, value
+
+
+def rss():
+    """Return resident memory of process in bytes (Linux only)."""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf(str('SC_PAGE_SIZE'))
+
+
+def run(engine, count):
+    """Fill storage with given number of keys, print bytes per key, sets,
+    gets and deletes per second.
+
+    """
+    storage = ENGINES[engine]()
+    sample = min(count, SAMPLE_SIZE)
+    base = rss()
+    started = time.time()
+    for i in range(count):
+        storage.set(*entry(i))
+    set_rate = count / (time.time() - started)
+    memory = rss() - base
+    keys = [entry(i)[0] for i in range(0, count, count // sample)]
+    started = time.time()
+    for key in keys:
+        storage.get(key)
+    get_rate = len(keys) / (time.time() - started)
+    started = time.time()
+    for key in keys:
+        storage.delete(key)
+    if engine == 'compact':
+        while storage.compact_step():
+            pass
+    delete_rate = len(keys) / (time.time() - started)
+    print(memory / count, set_rate, get_rate, delete_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keys', type=int, nargs='+', default=[1000000],
+                        help='number of keys to store')
+    parser.add_argument('--engines', nargs='+', default=sorted(ENGINES),
+                        choices=sorted(ENGINES), help='engines to compare')
+    parser.add_argument('--run', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args.run[0], int(args.run[1]))
+        return
+    print('{0:<8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+        'engine', 'keys', 'bytes/key', 'set/s', 'get/s', 'del/s'))
+    for count in args.keys:
+        for engine in args.engines:
+            output = subprocess.check_output(
+                [sys.executable, __file__, '--run', engine, str(count)])
+            result = map(float, output.split())
+            print('{0:<8} {1:>10} {2:>10.1f} {3:>10.0f} {4:>10.0f} {5:>10.0f}'
+                  .format(engine, count, *result))
+
+
+if __name__ == '__main__':
+    main()
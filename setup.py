@@ -86,6 +86,12 @@ setup(
     install_requires=install_requires,
     tests_require=['tox'],
     cmdclass={'test': Tox},
+    entry_points={
+        'console_scripts': [
+            'speicher-load = speicher.load:main',
+            'speicher-metrics = speicher.metrics:main',
+        ],
+    },
     license='MIT',
     include_package_data=True,
     classifiers=[
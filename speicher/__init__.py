@@ -14,3 +14,5 @@ __docformat__ = 'restructuredtext'
 
 from . import exceptions
 from .client import Speicher
+from .connection import RawValue
+from .replication import ReplicatedSpeicher
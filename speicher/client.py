@@ -2,10 +2,17 @@
 """Client implementation."""
 from __future__ import absolute_import, unicode_literals, print_function
 
+import time
+import random
+
 from six import binary_type, text_type
 
-from .connection import Connection
-from .exceptions import MalformedReply, ClientError, ServerError
+from .connection import (
+    Connection, encode_entries, decode_raw_entries, remaining, wait_any)
+from .exceptions import (
+    MalformedReply, ClientError, ServerError, ConnectionError, TimeoutError)
+from .stats import RollingPercentile
+from .writebehind import WriteBehindQueue, OVERFLOW_BLOCK
 
 #: No errors happened.
 CODE_OK = 200
@@ -13,6 +20,18 @@ CODE_OK = 200
 #: Key not found.
 CODE_NOT_FOUND = 404
 
+#: How many entries should be sent or received in one packet?
+BATCH_SIZE = 1000
+
+#: How many RESTORE packets can be sent before reading replies?
+RESTORE_WINDOW = 8
+
+#: Initial delay before GET is retried, in seconds.
+RETRY_BACKOFF = 0.01
+
+#: GET is hedged if it takes longer than this percentile of previous GETs.
+HEDGE_PERCENT = 95
+
 
 class Speicher(object):
     """Client to storage service.
@@ -34,10 +53,59 @@ class Speicher(object):
        None
        >>> c.close()
 
+    Writes can be made without waiting for reply with ``noreply`` flag::
+
+       >>> c.set('foo', 'bar', noreply=True)
+       >>> c.delete('foo', noreply=True)
+
+    With ``write_behind=True`` all ``set`` and ``delete`` calls are put into
+    bounded queue and streamed to the server in background over separate
+    connection, call ``flush`` to wait until they are sent::
+
+       >>> c = speicher.Speicher(write_behind=True, queue_size=1000,
+       ...                       overflow='drop-oldest')
+       >>> c.set('foo', 'bar')
+       >>> c.flush()
+       >>> c.write_queue.sent, c.write_queue.dropped, c.write_queue.errors
+       (1, 0, 0)
+
+    Every call but ``close`` accepts ``timeout`` that limits whole call
+    (whole iteration for ``dump``), while ``timeout`` of client limits each
+    socket operation and ``connect_timeout`` limits connect. Sockets are
+    created with ``TCP_NODELAY`` unless ``nodelay=False``, ``keepalive``
+    enables TCP keepalive probes every given seconds. Since GET is
+    idempotent, it is retried ``retries`` times on connection errors with
+    jittered exponential backoff. With ``hedge=True`` GET that takes longer
+    than 95th percentile of previous GETs is sent again over second
+    connection and first reply is used::
+
+       >>> c = speicher.Speicher(timeout=1.0, connect_timeout=0.1,
+       ...                       retries=2, hedge=True)
+       >>> c.get('foo', timeout=0.05)
+       'bar'
+
     """
 
-    def __init__(self, host=None, port=None, timeout=None):
-        self._conn = Connection(host, port, timeout)
+    def __init__(self, host=None, port=None, timeout=None,
+                 write_behind=False, queue_size=1000, overflow=OVERFLOW_BLOCK,
+                 connect_timeout=None, retries=0, backoff=RETRY_BACKOFF,
+                 hedge=False, nodelay=True, keepalive=None):
+        self._conn = Connection(host, port, timeout, connect_timeout,
+                                nodelay, keepalive)
+        self._hedge_conn = None
+        if hedge:
+            self._hedge_conn = Connection(host, port, timeout, connect_timeout,
+                                          nodelay, keepalive)
+        self.hedge_delay = RollingPercentile(HEDGE_PERCENT)
+        self.hedged = 0
+        self.retries = retries
+        self.backoff = backoff
+        self.write_queue = None
+        if write_behind:
+            self.write_queue = WriteBehindQueue(
+                host, port, timeout, maxsize=queue_size, overflow=overflow,
+                connect_timeout=connect_timeout, nodelay=nodelay,
+                keepalive=keepalive)
 
     def _prepare_key(self, key):
         """Prepare given key."""
@@ -49,10 +117,29 @@ class Speicher(object):
             raise TypeError('Key {0!r} is not string.'.format(key))
         return key
 
-    def _execute(self, command, **kwargs):
-        """Send command to server and return reply."""
-        self._conn.send(dict(command=command, **kwargs))
-        reply = self._conn.read()
+    @staticmethod
+    def _deadline(timeout):
+        """Convert timeout of call to deadline."""
+        return None if timeout is None else time.time() + timeout
+
+    def _execute(self, command, noreply=False, deadline=None, **kwargs):
+        """Send command to server and return reply. If ``noreply`` is set
+        server won't send reply, so return ``None`` immediately.
+
+        """
+        if noreply:
+            self._conn.send(dict(command=command, noreply=True, **kwargs),
+                            deadline)
+            return None
+        self._conn.send(dict(command=command, **kwargs), deadline)
+        return self._read_reply(deadline)
+
+    def _read_reply(self, deadline=None, decode=None):
+        """Read reply from server and check its status code."""
+        return self._check_reply(self._conn.read(deadline, decode))
+
+    def _check_reply(self, reply):
+        """Check status code of reply."""
         if not isinstance(reply, dict):
             raise MalformedReply('Reply is not dictionary.')
         if 'status_code' not in reply:
@@ -69,22 +156,100 @@ class Speicher(object):
                 'Unsupported status code {0}.'.format(status_code))
         return reply
 
-    def set(self, key, value):
+    def set(self, key, value, noreply=False, timeout=None):
         """Store given value at server with given key. Return nothing.
-        If value is ``None`` key will be deleted.
+        If value is ``None`` key will be deleted. Already encoded value can be
+        passed as :class:`~speicher.connection.RawValue`.
 
         """
         if value is None:
-            self.delete(key)
+            self.delete(key, noreply=noreply, timeout=timeout)
         else:
             key = self._prepare_key(key)
-            self._execute(b'SET', key=key, value=value)
+            if self.write_queue is not None:
+                self.write_queue.put(b'SET', key=key, value=value)
+            else:
+                self._execute(b'SET', noreply=noreply,
+                              deadline=self._deadline(timeout),
+                              key=key, value=value)
 
-    def get(self, key):
-        """Get value from server, return ``None`` if no value found."""
+    def _prepare_hedge(self, deadline):
+        """Discard replies to requests that lost earlier races if they have
+        arrived and connect hedge connection in advance, so hedge isn't
+        delayed by connect. If such reply is still outstanding, hedge would
+        wait behind it, so connection is replaced.
+
+        """
+        conn = self._hedge_conn
+        try:
+            while conn.stale and conn.wait_readable(0):
+                conn.read(deadline)
+                conn.stale -= 1
+            if conn.stale:
+                conn.disconnect()
+            conn.connect(deadline)
+        except ConnectionError:
+            conn.disconnect()
+
+    def _hedged_get(self, key, deadline):
+        """Send GET and, if there is no reply after 95th percentile of
+        previous GETs, send it again over second connection. Connection that
+        loses the race is kept and its reply is discarded later.
+
+        """
+        self._prepare_hedge(deadline)
+        data = dict(command=b'GET', key=key)
+        started = time.time()
+        self._conn.send(data, deadline)
+        conns = [self._conn]
+        try:
+            delay = self.hedge_delay.value
+            if (delay is not None and
+                    not self._conn.wait_readable(remaining(deadline, delay))):
+                try:
+                    self._hedge_conn.send(data, deadline)
+                except ConnectionError:
+                    pass
+                else:
+                    conns.append(self._hedge_conn)
+                    self.hedged += 1
+            winner = wait_any(conns, remaining(deadline, self._conn.timeout))
+            if winner is None:
+                raise TimeoutError(b"Timeout while waiting for reply.")
+        except Exception:
+            for conn in conns:
+                conn.disconnect()
+            raise
+        if winner is self._hedge_conn:
+            # faster connection becomes main one
+            self._conn, self._hedge_conn = self._hedge_conn, self._conn
+        if len(conns) > 1:
+            self._hedge_conn.stale += 1
+        reply = self._conn.read(deadline)
+        self.hedge_delay.record(time.time() - started)
+        return self._check_reply(reply)
+
+    def _request_get(self, key, deadline):
+        """Send GET, retry it on connection errors."""
+        attempt = 0
+        while True:
+            try:
+                if self._hedge_conn is not None:
+                    return self._hedged_get(key, deadline)
+                return self._execute(b'GET', deadline=deadline, key=key)
+            except ConnectionError:
+                if attempt >= self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if deadline is not None and time.time() + delay >= deadline:
+                    raise
+                attempt += 1
+            time.sleep(delay)
+
+    def _get_value(self, key, deadline):
         key = self._prepare_key(key)
         try:
-            reply = self._execute(b'GET', key=key)
+            reply = self._request_get(key, deadline)
         except ClientError as exc:
             if exc.status_code == CODE_NOT_FOUND:
                 # return ``None`` on not found error.
@@ -96,14 +261,26 @@ class Speicher(object):
             except KeyError:
                 raise MalformedReply('Key "value" not exists in reply.')
 
-    def delete(self, key):
+    def get(self, key, timeout=None):
+        """Get value from server, return ``None`` if no value found."""
+        return self._get_value(key, self._deadline(timeout))
+
+    def delete(self, key, noreply=False, timeout=None):
         """Delete value from server, return ``True`` if value deleted,
-        otherwise return ``False``.
+        otherwise return ``False``. Return ``None`` if ``noreply`` is set
+        or write-behind queue is used.
 
         """
         key = self._prepare_key(key)
+        if self.write_queue is not None:
+            self.write_queue.put(b'DEL', key=key)
+            return None
+        deadline = self._deadline(timeout)
+        if noreply:
+            self._execute(b'DEL', noreply=True, deadline=deadline, key=key)
+            return None
         try:
-            self._execute(b'DEL', key=key)
+            self._execute(b'DEL', deadline=deadline, key=key)
         except ClientError as exc:
             if exc.status_code == CODE_NOT_FOUND:
                 # return ``None`` on not found error.
@@ -112,15 +289,109 @@ class Speicher(object):
         else:
             return True
 
-    def reset(self):
+    def reset(self, timeout=None):
         """Delete all values from server, return ``True`` if no error happened,
-        otherwise return ``False``.
+        otherwise return ``False``. With write-behind queue RST is sent over
+        its connection, so it is applied after all queued writes.
 
         """
-        self._execute(b'RST')
+        deadline = self._deadline(timeout)
+        if self.write_queue is not None:
+            self._check_reply(self.write_queue.execute(b'RST', deadline))
+        else:
+            self._execute(b'RST', deadline=deadline)
+
+    def dump(self, batch_size=BATCH_SIZE, timeout=None, raw=False):
+        """Iterate over all keys and values stored at server. Server streams
+        them in batches of given size. ``timeout`` limits whole iteration.
+        With ``raw=True`` values are :class:`~speicher.connection.RawValue`
+        with JSON as received, so they can be passed to :meth:`restore`
+        without decoding and encoding again.
+
+        """
+        deadline = self._deadline(timeout)
+        decode = decode_raw_entries if raw else None
+        self._conn.send(dict(command=b'DUMP', batch_size=batch_size),
+                        deadline)
+        finished = False
+        try:
+            while not finished:
+                reply = self._read_reply(deadline, decode)
+                try:
+                    entries = reply['entries']
+                except KeyError:
+                    raise MalformedReply('Key "entries" not exists in reply.')
+                finished = reply.get('done', False)
+                for key, value in entries:
+                    yield key, value
+        finally:
+            if not finished:
+                # rest of stream can't be skipped, so drop connection
+                self._conn.disconnect()
+
+    def _send_batch(self, batch, deadline=None):
+        self._conn.send(dict(command=b'RESTORE', entries=encode_entries(batch)),
+                        deadline)
+
+    def restore(self, entries, batch_size=BATCH_SIZE, window=RESTORE_WINDOW,
+                timeout=None):
+        """Store all keys and values from given iterable of pairs, values
+        may be :class:`~speicher.connection.RawValue`. Entries are sent in
+        batches of given size and up to ``window`` batches are sent before
+        waiting for reply. Return number of stored entries.
+
+        """
+        deadline = self._deadline(timeout)
+        count = pending = 0
+        batch = []
+        try:
+            for key, value in entries:
+                batch.append((self._prepare_key(key), value))
+                if len(batch) < batch_size:
+                    continue
+                if pending >= window:
+                    pending -= 1
+                    self._read_reply(deadline)
+                self._send_batch(batch, deadline)
+                count += len(batch)
+                pending += 1
+                batch = []
+            if batch:
+                self._send_batch(batch, deadline)
+                count += len(batch)
+                pending += 1
+            while pending:
+                pending -= 1
+                self._read_reply(deadline)
+        except Exception:
+            if pending:
+                # replies to sent batches can't be skipped, so drop connection
+                self._conn.disconnect()
+            raise
+        return count
+
+    def stats(self, timeout=None):
+        """Return statistics of server as dictionary, see STATS command."""
+        reply = self._execute(b'STATS', deadline=self._deadline(timeout))
+        try:
+            return reply['stats']
+        except KeyError:
+            raise MalformedReply('Key "stats" not exists in reply.')
+
+    def flush(self, timeout=None):
+        """Wait until all writes from write-behind queue are sent."""
+        if self.write_queue is not None:
+            self.write_queue.flush(self._deadline(timeout))
 
     def close(self):
-        """Close connection to server if it exists."""
+        """Drain write-behind queue and close connection to server
+        if it exists.
+
+        """
+        if self.write_queue is not None:
+            self.write_queue.close()
+        if self._hedge_conn is not None:
+            self._hedge_conn.disconnect()
         self._conn.disconnect()
 
     def __del__(self):
@@ -2,13 +2,19 @@
 """Connection implementation."""
 from __future__ import absolute_import, unicode_literals, print_function
 
+import re
+import json
+import time
+import random
 import struct
+import select
 import socket
 from io import BytesIO
 
 import anyjson
+from six import binary_type, PY3
 
-from .exceptions import ConnectionError
+from .exceptions import ConnectionError, TimeoutError
 
 #: Format to encode message length.
 LENGTH_FORMAT = b'!i'
@@ -16,18 +22,158 @@ LENGTH_FORMAT = b'!i'
 #: How many bytes should we receive from socket?
 MAX_READ_LENGTH = 1000000
 
+#: Maximal delay before reconnect, in seconds.
+MAX_RECONNECT_BACKOFF = 2.0
+
+#: Whitespace allowed between JSON tokens.
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+#: Start of ``[key, value]`` pair up to opening quote of key.
+PAIR_START = re.compile(r'[ \t\n\r]*\[[ \t\n\r]*"')
+
+#: Separator of key and value in pair.
+PAIR_SEPARATOR = re.compile(r'[ \t\n\r]*,[ \t\n\r]*')
+
+#: End of pair and comma if next pair follows.
+PAIR_END = re.compile(r'[ \t\n\r]*\][ \t\n\r]*(,)?')
+
+decoder = json.JSONDecoder()
+
+
+def remaining(deadline, timeout):
+    """Return how many seconds left until given deadline (absolute time),
+    but not more than ``timeout``. Raise :class:`TimeoutError` if deadline
+    has passed.
+
+    """
+    if deadline is None:
+        return timeout
+    left = deadline - time.time()
+    if left <= 0:
+        raise TimeoutError(b"Deadline exceeded.")
+    return min(left, timeout)
+
+
+class RawValue(binary_type):
+    """Already JSON-encoded value. It is spliced into packet as is, so
+    encoded value doesn't serialized again on every send.
+
+    """
+
+
+def encode_entries(entries):
+    """Encode sequence of key and value pairs to JSON list of pairs. Values
+    that are instances of :class:`RawValue` are spliced as is.
+
+    """
+    parts = []
+    for key, value in entries:
+        if not isinstance(value, RawValue):
+            value = anyjson.serialize(value)
+        parts.append(b'[' + anyjson.serialize(key) + b', ' + value + b']')
+    return RawValue(b'[' + b', '.join(parts) + b']')
+
+
+def _skip(text, idx):
+    """Return index of first non-whitespace character from ``idx``."""
+    return WHITESPACE.match(text, idx).end()
+
+
+def _raw_pairs(text, idx):
+    """Scan JSON list of ``[key, value]`` pairs that starts at ``idx``,
+    return list of keys and :class:`RawValue` slices and index after list.
+
+    """
+    scanstring, scan_once = json.decoder.scanstring, decoder.scan_once
+    pairs = []
+    idx += 1  # skip '['
+    match = PAIR_START.match(text, idx)
+    while match is not None:
+        key, idx = scanstring(text, match.end())
+        idx = PAIR_SEPARATOR.match(text, idx).end()
+        end = scan_once(text, idx)[1]
+        value = text[idx:end]
+        pairs.append((key, RawValue(value.encode('utf-8') if PY3 else value)))
+        match = PAIR_END.match(text, end)
+        idx = match.end()
+        if match.group(1) is None:
+            break
+        match = PAIR_START.match(text, idx)
+    idx = _skip(text, idx)
+    if text[idx] != ']':
+        raise ValueError('Expected end of list at {0}.'.format(idx))
+    return pairs, idx + 1
+
+
+def decode_raw_entries(payload, field='entries'):
+    """Decode JSON object of packet, but leave values of ``[key, value]``
+    pairs in given field as :class:`RawValue` slices of payload, so they
+    can be sent again without encoding.
+
+    """
+    text = payload.decode('utf-8') if PY3 else payload
+    data = {}
+    try:
+        idx = _skip(text, _skip(text, 0) + 1)  # skip '{'
+        while text[idx] != '}':
+            key, idx = json.decoder.scanstring(text, idx + 1)
+            idx = _skip(text, _skip(text, idx) + 1)  # skip ':'
+            if key == field and text[idx] == '[':
+                data[key], idx = _raw_pairs(text, idx)
+            else:
+                data[key], idx = decoder.raw_decode(text, idx)
+            idx = _skip(text, idx)
+            if text[idx] == ',':
+                idx = _skip(text, idx + 1)
+    except (IndexError, AttributeError, StopIteration):
+        raise ValueError('Packet is broken or truncated.')
+    return data
+
+
+def wait_any(connections, timeout):
+    """Return first of given connections that has reply to read or ``None``
+    on timeout.
+
+    """
+    socks = dict((conn._sock, conn) for conn in connections
+                 if conn._sock is not None)
+    if not socks:
+        return None
+    readable = select.select(list(socks), [], [], timeout)[0]
+    return socks[readable[0]] if readable else None
+
 
 class Connection(object):
-    """Represent connection to storage. Work with plain TCP connection."""
+    """Represent connection to storage. Work with plain TCP connection.
+
+    ``timeout`` limits each socket operation, ``connect_timeout`` limits
+    connect only (``timeout`` by default). Methods accept optional
+    ``deadline`` (absolute time) that limits whole request. If ``backoff``
+    is set, after failed connect next connect attempts fail immediately
+    until jittered delay, starting from ``backoff`` seconds and growing
+    exponentially up to ``max_backoff``, passes.
+
+    """
 
     length_size = struct.calcsize(LENGTH_FORMAT)
     length_struct = struct.Struct(LENGTH_FORMAT)
 
-    def __init__(self, host=None, port=None, timeout=None):
+    def __init__(self, host=None, port=None, timeout=None,
+                 connect_timeout=None, nodelay=True, keepalive=None,
+                 backoff=None, max_backoff=MAX_RECONNECT_BACKOFF):
         self._sock = None
+        self._failures = 0
+        self._retry_at = 0.0
+        #: How many replies should be read and discarded before next one.
+        self.stale = 0
         self.host = host or b'localhost'
         self.port = port or 14567
         self.timeout = timeout or 10.0
+        self.connect_timeout = connect_timeout or self.timeout
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.backoff = backoff
+        self.max_backoff = max_backoff
 
     @staticmethod
     def _decode_packet(msg):
@@ -36,31 +182,77 @@ class Connection(object):
 
     @staticmethod
     def _encode_packet(data):
-        """Encode given data to JSON."""
-        return anyjson.serialize(data)
+        """Encode given data to JSON. Values of dictionary that are instances
+        of :class:`RawValue` are spliced into result without encoding.
+
+        """
+        if not isinstance(data, dict):
+            return anyjson.serialize(data)
+        raw = [(k, v) for k, v in data.items() if isinstance(v, RawValue)]
+        if not raw:
+            return anyjson.serialize(data)
+        rest = dict((k, v) for k, v in data.items()
+                    if not isinstance(v, RawValue))
+        parts = [anyjson.serialize(k) + b': ' + v for k, v in raw]
+        if rest:
+            parts.append(anyjson.serialize(rest)[1:-1])
+        return b'{' + b', '.join(parts) + b'}'
 
-    def _create_connection(self):
+    def _set_options(self, sock):
+        """Disable Nagle's algorithm and enable TCP keepalive if needed."""
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # probe idle connection every ``keepalive`` seconds (Linux only)
+            for name in ('TCP_KEEPIDLE', 'TCP_KEEPINTVL'):
+                if hasattr(socket, name):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name),
+                                    max(int(self.keepalive), 1))
+
+    def _create_connection(self, deadline=None):
         """Create a TCP socket connection."""
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(self.timeout)
-        sock.connect((self.host, self.port))
+        try:
+            self._set_options(sock)
+            sock.settimeout(remaining(deadline, self.connect_timeout))
+            sock.connect((self.host, self.port))
+        except Exception:
+            sock.close()
+            raise
         return sock
 
-    def connect(self):
+    @property
+    def retry_delay(self):
+        """How many seconds left before next connect attempt is allowed."""
+        return max(self._retry_at - time.time(), 0.0)
+
+    def connect(self, deadline=None):
         """Connects to the server if not already connected."""
         if self._sock is not None:
             return
+        if self.retry_delay > 0:
+            raise ConnectionError(
+                b"Reconnect to {0}:{1} is delayed after error."
+                .format(self.host, self.port))
         try:
-            sock = self._create_connection()
+            sock = self._create_connection(deadline)
         except IOError as exc:
+            if self.backoff is not None:
+                self._failures += 1
+                delay = min(self.backoff * 2 ** (self._failures - 1),
+                            self.max_backoff)
+                self._retry_at = time.time() + random.uniform(0, delay)
             msg = b"Error connecting {0}:{1}. {2}.".format(
                 self.host, self.port, exc.args)
             raise ConnectionError(msg)
         else:
+            self._failures = 0
             self._sock = sock
 
     def disconnect(self):
         """Disconnects from the server and close socket."""
+        self.stale = 0
         if self._sock is None:
             return
         try:
@@ -70,6 +262,19 @@ class Connection(object):
         finally:
             self._sock = None
 
+    def shutdown(self):
+        """Shut down socket without closing it, so read blocked in other
+        thread fails immediately.
+
+        """
+        sock = self._sock
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except IOError:
+            pass
+
     def __del__(self):
         """Close socket in GC."""
         self.disconnect()
@@ -82,13 +287,21 @@ class Connection(object):
         payload = self._encode_packet(data)
         return self.length_struct.pack(len(payload)) + payload
 
-    def send(self, data):
+    def send(self, data, deadline=None):
         """Send given data to the server."""
+        self.send_many([data], deadline)
+
+    def send_many(self, items, deadline=None):
+        """Send given sequence of data to the server in one write."""
         if self._sock is None:
-            self.connect()
+            self.connect(deadline)
         try:
-            # send packed message to server
-            self._sock.sendall(self._create_packet(data))
+            self._sock.settimeout(remaining(deadline, self.timeout))
+            # send all packed messages to server at once
+            self._sock.sendall(b''.join(map(self._create_packet, items)))
+        except socket.timeout:
+            self.disconnect()
+            raise TimeoutError(b"Timeout while writing to socket.")
         except IOError as exc:
             self.disconnect()
             raise ConnectionError(
@@ -98,16 +311,21 @@ class Connection(object):
             self.disconnect()
             raise
 
-    def _recv_msg(self, length):
+    def wait_readable(self, timeout):
+        """Wait until reply can be read, return ``False`` on timeout."""
+        return wait_any([self], timeout) is self
+
+    def _recv_msg(self, length, deadline=None):
+        self._sock.settimeout(remaining(deadline, self.timeout))
         msg = self._sock.recv(length)
         if len(msg) == 0:
             raise ConnectionError(
                 b"Error reading from socket: end-of-file.")
         return msg
 
-    def _read_length(self):
+    def _read_length(self, deadline=None):
         """Read length from socket."""
-        buf = self._recv_msg(self.length_size)
+        buf = self._read_payload(self.length_size, deadline)
         try:
             length = self.length_struct.unpack(buf)[0]
         except struct.error:
@@ -116,7 +334,7 @@ class Connection(object):
             raise ConnectionError(b"Packet length should be positive integer.")
         return length
 
-    def _read_payload(self, bytes_left):
+    def _read_payload(self, bytes_left, deadline=None):
         """Read payload from socket."""
         # create buffer to read into
         buf = BytesIO()
@@ -124,21 +342,27 @@ class Connection(object):
             # read from socket by small chunk
             while bytes_left > 0:
                 read_len = min(bytes_left, MAX_READ_LENGTH)
-                chunk = self._recv_msg(read_len)
+                chunk = self._recv_msg(read_len, deadline)
                 buf.write(chunk)
                 bytes_left -= len(chunk)
             return buf.getvalue()
         finally:
             buf.close()
 
-    def read(self):
-        """Read the response from a previously sent command."""
+    def read(self, deadline=None, decode=None):
+        """Read the response from a previously sent command. Payload is
+        decoded by ``decode`` callable if it is given.
+
+        """
         assert self._sock is not None
         try:
-            length = self._read_length()
-            payload = self._read_payload(length)
-            data = self._decode_packet(payload)
-        except (IOError, socket.timeout) as exc:
+            length = self._read_length(deadline)
+            payload = self._read_payload(length, deadline)
+            data = (decode or self._decode_packet)(payload)
+        except socket.timeout:
+            self.disconnect()
+            raise TimeoutError(b"Timeout while reading from socket.")
+        except IOError as exc:
             self.disconnect()
             raise ConnectionError(
                 b"Error while reading from socket: {0}"
@@ -16,6 +16,10 @@ class ConnectionError(SpeicherError):
     """Raised on socket error."""
 
 
+class TimeoutError(ConnectionError):
+    """Raised if deadline of request exceeded."""
+
+
 class MalformedReply(SpeicherError):
     """Raised if wrong reply returned by server."""
 
@@ -0,0 +1,226 @@
+# coding: utf-8
+"""Export, import and copy all entries of storage."""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import sys
+import time
+import struct
+import argparse
+
+import anyjson
+from six import text_type
+
+from .client import Speicher, BATCH_SIZE
+from .connection import RawValue
+from .exceptions import SpeicherError
+from .storage import HEADER_FORMAT
+
+#: First bytes of binary dump.
+BINARY_MAGIC = b'SPEICHER1\n'
+
+#: One JSON object with ``key`` and ``value`` per line.
+FORMAT_JSONL = 'jsonl'
+
+#: Magic followed by records of key length, value length, key and JSON value.
+FORMAT_BINARY = 'binary'
+
+header = struct.Struct(HEADER_FORMAT)
+
+
+class Progress(object):
+    """Report number of processed entries at most once per ``interval``."""
+
+    def __init__(self, action, stream=None, interval=1.0, clock=time.time):
+        self.action = action
+        self.stream = stream
+        self.interval = interval
+        self._clock = clock
+        self.count = 0
+        self.started = self._reported = clock()
+
+    def _report(self, now):
+        if self.stream is None:
+            return
+        rate = self.count / max(now - self.started, 1e-6)
+        self.stream.write('{0}: {1} entries, {2:.0f}/s\n'.format(
+            self.action, self.count, rate))
+        self.stream.flush()
+
+    def update(self, count=1):
+        self.count += count
+        now = self._clock()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self._report(now)
+
+    def finish(self):
+        self._report(self._clock())
+
+    def wrap(self, entries):
+        """Count entries while iterating over them."""
+        for entry in entries:
+            yield entry
+            self.update()
+
+
+def write_jsonl(entries, stream):
+    for key, value in entries:
+        stream.write(anyjson.serialize(dict(key=key, value=value)) + b'\n')
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        item = anyjson.deserialize(line)
+        yield item['key'], item['value']
+
+
+def write_binary(entries, stream):
+    """Write entries to binary dump, values that are instances of
+    :class:`~speicher.connection.RawValue` are written as is.
+
+    """
+    stream.write(BINARY_MAGIC)
+    for key, value in entries:
+        if isinstance(key, text_type):
+            key = key.encode('utf-8')
+        if not isinstance(value, RawValue):
+            value = anyjson.serialize(value)
+        stream.write(header.pack(len(key), len(value)) + key + value)
+
+
+def _read_exactly(stream, length):
+    data = stream.read(length)
+    if len(data) != length:
+        raise ValueError('Binary dump is truncated.')
+    return data
+
+
+def read_binary(stream):
+    """Read entries from binary dump, values aren't decoded."""
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError('Stream is not binary dump.')
+    while True:
+        data = stream.read(header.size)
+        if not data:
+            break
+        if len(data) != header.size:
+            raise ValueError('Binary dump is truncated.')
+        key_length, value_length = header.unpack(data)
+        key = _read_exactly(stream, key_length)
+        yield key, RawValue(_read_exactly(stream, value_length))
+
+
+WRITERS = {FORMAT_JSONL: write_jsonl, FORMAT_BINARY: write_binary}
+
+READERS = {FORMAT_JSONL: read_jsonl, FORMAT_BINARY: read_binary}
+
+
+def _guess_format(args, filename):
+    if args.format is not None:
+        return args.format
+    return FORMAT_BINARY if filename.endswith('.bin') else FORMAT_JSONL
+
+
+def _open(filename, mode, std):
+    if filename == '-':
+        return getattr(std, 'buffer', std)
+    return open(filename, mode)
+
+
+def export(args, progress):
+    client = Speicher(args.host, args.port, args.timeout)
+    stream = _open(args.output, 'wb', sys.stdout)
+    try:
+        output_format = _guess_format(args, args.output)
+        # binary dump keeps values as received from server
+        entries = client.dump(args.batch_size,
+                              raw=output_format == FORMAT_BINARY)
+        WRITERS[output_format](progress.wrap(entries), stream)
+    finally:
+        stream.flush()
+        if args.output != '-':
+            stream.close()
+        client.close()
+
+
+def load(args, progress):
+    client = Speicher(args.host, args.port, args.timeout)
+    stream = _open(args.input, 'rb', sys.stdin)
+    try:
+        if args.reset:
+            client.reset()
+        reader = READERS[_guess_format(args, args.input)]
+        client.restore(progress.wrap(reader(stream)), args.batch_size)
+    finally:
+        if args.input != '-':
+            stream.close()
+        client.close()
+
+
+def copy(args, progress):
+    source = Speicher(args.host, args.port, args.timeout)
+    target = Speicher(args.to_host, args.to_port, args.timeout)
+    try:
+        if args.reset:
+            target.reset()
+        entries = progress.wrap(source.dump(args.batch_size, raw=True))
+        target.restore(entries, args.batch_size)
+    finally:
+        source.close()
+        target.close()
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='speicher-load', description=__doc__)
+    parser.add_argument('--host', default='localhost', help='server host')
+    parser.add_argument('--port', type=int, default=14567, help='server port')
+    parser.add_argument('--timeout', type=float, help='socket timeout')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='entries per packet')
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't report progress")
+    commands = parser.add_subparsers(dest='command')
+
+    formats = sorted(WRITERS)
+    command = commands.add_parser('export', help='export entries to file')
+    command.add_argument('output', help='file name or "-" for stdout')
+    command.add_argument('--format', choices=formats,
+                         help='file format, "binary" for *.bin by default')
+    command.set_defaults(handler=export)
+
+    command = commands.add_parser('import', help='import entries from file')
+    command.add_argument('input', help='file name or "-" for stdin')
+    command.add_argument('--format', choices=formats,
+                         help='file format, "binary" for *.bin by default')
+    command.add_argument('--reset', action='store_true',
+                         help='delete all entries before import')
+    command.set_defaults(handler=load)
+
+    command = commands.add_parser('copy', help='copy entries to other server')
+    command.add_argument('--to-host', default='localhost',
+                         help='target server host')
+    command.add_argument('--to-port', type=int, required=True,
+                         help='target server port')
+    command.add_argument('--reset', action='store_true',
+                         help='delete all entries of target before copy')
+    command.set_defaults(handler=copy)
+    return parser
+
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    progress = Progress(args.command, None if args.quiet else sys.stderr)
+    try:
+        args.handler(args, progress)
+    except (SpeicherError, ValueError, IOError) as exc:
+        parser.exit(1, '{0}: error: {1}\n'.format(parser.prog, exc))
+    progress.finish()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""Serve statistics of server as plain-text metrics over HTTP."""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import sys
+import argparse
+from threading import Thread
+
+from six.moves import BaseHTTPServer
+
+from .client import Speicher
+from .exceptions import SpeicherError
+from .stats import format_metrics
+
+#: Port of metrics endpoint by default.
+METRICS_PORT = 14570
+
+#: Content type of plain-text metrics.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Reply to every GET with metrics, 503 if server can't be reached."""
+
+    def do_GET(self):
+        try:
+            body = format_metrics(self.server.client.stats())
+        except SpeicherError as exc:
+            self.send_error(503, str(exc))
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header(str('Content-Type'), str(CONTENT_TYPE))
+        self.send_header(str('Content-Length'), str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    """HTTP endpoint on local port that polls STATS of given server on
+    each request and replies with :func:`~speicher.stats.format_metrics`.
+    It uses its own client, so it can run next to application::
+
+       >>> m = MetricsServer(host='localhost', port=14567,
+       ...                   listen=('127.0.0.1', 14570))
+       >>> m.start()
+       >>> m.stop()
+
+    """
+
+    def __init__(self, host=None, port=None, timeout=None,
+                 listen=('127.0.0.1', METRICS_PORT)):
+        self.client = Speicher(host, port, timeout)
+        self._httpd = BaseHTTPServer.HTTPServer(listen, MetricsHandler)
+        self._httpd.client = self.client
+        self._thread = None
+        self.address = self._httpd.server_address
+
+    def serve_forever(self, poll_interval=0.1):
+        """Serve metrics until :meth:`stop` is called."""
+        self._httpd.serve_forever(poll_interval)
+
+    def start(self):
+        """Serve metrics in background thread."""
+        thread = self._thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop serving and close listening socket and client."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
+        self.client.close()
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='speicher-metrics',
+                                     description=__doc__)
+    parser.add_argument('--host', default='localhost', help='server host')
+    parser.add_argument('--port', type=int, default=14567, help='server port')
+    parser.add_argument('--timeout', type=float, help='socket timeout')
+    parser.add_argument('--listen-host', default='127.0.0.1',
+                        help='address of metrics endpoint')
+    parser.add_argument('--listen-port', type=int, default=METRICS_PORT,
+                        help='port of metrics endpoint')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    server = MetricsServer(args.host, args.port, args.timeout,
+                           listen=(args.listen_host, args.listen_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# coding: utf-8
+"""Replication: replica side of replication stream and client that reads
+from replicas.
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+from threading import Thread
+
+import anyjson
+from six import text_type
+
+from .client import Speicher, BATCH_SIZE, CODE_OK
+from .connection import Connection
+from .exceptions import SpeicherError, MalformedReply
+
+#: How long to wait before reconnecting to primary, in seconds.
+RETRY_DELAY = 1.0
+
+#: How long replica lag reported by STATS is trusted, in seconds.
+CHECK_INTERVAL = 1.0
+
+#: Share of time left until deadline of GET that lag check may take,
+#: the rest is left for reading from replica or primary.
+CHECK_SHARE = 0.5
+
+#: How often idle primary sends PING, in seconds.
+PING_INTERVAL = 1.0
+
+#: Stream is treated as dead if nothing received for this many pings.
+DEAD_PINGS = 3
+
+
+class Follower(object):
+    """Keep given storage (see :mod:`speicher.storage`) in sync with primary.
+
+    Follower sends SYNC to primary, replaces content of storage with
+    received entries and then applies stream of SET, DEL and RST. On
+    connection error or broken frame everything starts again after
+    ``retry_delay``. Server should run it with :meth:`start` and report
+    :attr:`lag` and :attr:`offset` in ``replication`` section of STATS.
+
+    """
+
+    def __init__(self, host, port, storage, timeout=None,
+                 batch_size=BATCH_SIZE, retry_delay=RETRY_DELAY,
+                 dead_interval=DEAD_PINGS * PING_INTERVAL, clock=time.time):
+        self._conn = Connection(host, port, timeout)
+        self._clock = clock
+        self._thread = None
+        self._stopped = False
+        self.storage = storage
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.dead_interval = dead_interval
+        self.synced = False
+        self.offset = None
+        self.primary_time = None
+        self.received_at = None
+
+    @property
+    def lag(self):
+        """How far replica is behind primary in seconds, i.e. how late last
+        frame arrived after primary made it. ``None`` if initial sync is not
+        finished or nothing was received for ``dead_interval`` seconds.
+
+        """
+        if (not self.synced or
+                self._clock() - self.received_at > self.dead_interval):
+            return None
+        return max(self.received_at - self.primary_time, 0.0)
+
+    def _read(self):
+        frame = self._conn.read()
+        if not isinstance(frame, dict) or frame.get('status_code') != CODE_OK:
+            raise MalformedReply('Wrong replication frame {0!r}.'.format(frame))
+        return frame
+
+    @staticmethod
+    def _key(key):
+        return key.encode('utf-8') if isinstance(key, text_type) else key
+
+    def sync(self):
+        """Request primary and load all its entries."""
+        self.synced = False
+        self._conn.send(dict(command=b'SYNC', batch_size=self.batch_size))
+        self.storage.reset()
+        while True:
+            frame = self._read()
+            for key, value in frame.get('entries', ()):
+                self.storage.set(self._key(key), anyjson.serialize(value))
+            if frame.get('done'):
+                break
+        self._advance(frame)
+        self.synced = True
+
+    def _advance(self, frame):
+        self.received_at = self._clock()
+        self.offset = frame.get('offset', self.offset)
+        self.primary_time = frame.get('time', self.received_at)
+
+    def step(self):
+        """Read one operation from stream and apply it."""
+        frame = self._read()
+        command = frame.get('command')
+        if command == 'SET':
+            self.storage.set(self._key(frame['key']),
+                             anyjson.serialize(frame['value']))
+        elif command == 'DEL':
+            self.storage.delete(self._key(frame['key']))
+        elif command == 'RST':
+            self.storage.reset()
+        elif command != 'PING':
+            raise MalformedReply('Unknown replication command {0!r}.'
+                                 .format(command))
+        self._advance(frame)
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.sync()
+                while not self._stopped:
+                    self.step()
+            except Exception:  # broken frame or storage error, sync again
+                self.synced = False
+                self._conn.disconnect()
+                if not self._stopped:
+                    time.sleep(self.retry_delay)
+        self._conn.disconnect()
+
+    def start(self):
+        """Start replication in background thread."""
+        thread = self._thread = Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self, timeout=None):
+        """Stop replication and wait for background thread."""
+        self._stopped = True
+        self._conn.shutdown()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class Replica(object):
+    """Client to replica with last known replication lag."""
+
+    def __init__(self, client):
+        self.client = client
+        self.lag = None
+        self.checked = None
+
+    def refresh(self, now, deadline=None):
+        """Ask replica about its lag, replica that can't answer is treated
+        as not synced until next check. If ``deadline`` (absolute time) is
+        given, check takes not more than :data:`CHECK_SHARE` of time left.
+
+        """
+        self.checked = now
+        timeout = None
+        if deadline is not None:
+            timeout = (deadline - time.time()) * CHECK_SHARE
+        try:
+            self.lag = self.client.stats(timeout)['replication']['lag']
+        except (SpeicherError, KeyError, TypeError):
+            self.lag = None
+            self.client.close()
+
+
+class ReplicatedSpeicher(Speicher):
+    """Client that sends writes to primary and spreads GETs across replicas
+    round-robin. Replica is used only if its lag, as reported by STATS not
+    longer than ``check_interval`` ago, doesn't exceed ``max_staleness``,
+    otherwise value is read from primary.
+
+    For example::
+
+       >>> c = ReplicatedSpeicher(host='localhost', port=14567,
+       ...                        replicas=[('localhost', 14568),
+       ...                                  ('localhost', 14569)],
+       ...                        max_staleness=0.5)
+       >>> c.set('foo', 'bar')
+       >>> c.get('foo')  # from replica if it has caught up
+       'bar'
+
+    """
+
+    def __init__(self, host=None, port=None, timeout=None, replicas=(),
+                 max_staleness=1.0, check_interval=CHECK_INTERVAL,
+                 clock=time.time, **kwargs):
+        super(ReplicatedSpeicher, self).__init__(host, port, timeout, **kwargs)
+        options = dict((name, kwargs[name]) for name in
+                       ('connect_timeout', 'retries', 'backoff', 'hedge',
+                        'nodelay', 'keepalive')
+                       if name in kwargs)
+        self.replicas = [
+            Replica(Speicher(replica_host, replica_port, timeout, **options))
+            for replica_host, replica_port in replicas]
+        self.max_staleness = max_staleness
+        self.check_interval = check_interval
+        self._clock = clock
+        self._next = 0
+
+    def _choose_replica(self, deadline=None):
+        """Return next replica that is fresh enough or ``None``."""
+        now = self._clock()
+        count = len(self.replicas)
+        for i in range(count):
+            replica = self.replicas[(self._next + i) % count]
+            if (replica.checked is None or
+                    now - replica.checked >= self.check_interval):
+                replica.refresh(now, deadline)
+            if replica.lag is not None and replica.lag <= self.max_staleness:
+                self._next = (self._next + i + 1) % count
+                return replica
+        return None
+
+    def get(self, key, timeout=None):
+        """Get value from fresh replica or from primary if there is
+        no such replica.
+
+        """
+        deadline = self._deadline(timeout)
+        replica = self._choose_replica(deadline)
+        if replica is not None:
+            try:
+                return replica.client._get_value(key, deadline)
+            except SpeicherError:
+                replica.lag = None
+        return self._get_value(key, deadline)
+
+    def close(self):
+        """Close connections to primary and replicas."""
+        for replica in getattr(self, 'replicas', ()):
+            replica.client.close()
+        super(ReplicatedSpeicher, self).close()
@@ -0,0 +1,202 @@
+# coding: utf-8
+"""Statistics collection for server implementations."""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import math
+import time
+from collections import defaultdict
+
+from six import iteritems
+
+#: Smallest duration that histogram distinguishes, in seconds.
+HISTOGRAM_UNIT = 1e-6
+
+#: Number of buckets per power of two, relative error is at most 1/16.
+HISTOGRAM_SUB_BUCKETS = 16
+
+#: Length of statistics window, in seconds.
+STATS_WINDOW = 10.0
+
+
+class Histogram(object):
+    """Log-linear histogram of durations. Recording is O(1) and allocates
+    nothing for already seen buckets.
+
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, value):
+        """Record duration in seconds."""
+        mantissa, exponent = math.frexp(max(value, HISTOGRAM_UNIT) /
+                                        HISTOGRAM_UNIT)
+        sub_bucket = int((mantissa - 0.5) * 2 * HISTOGRAM_SUB_BUCKETS)
+        self.counts[exponent * HISTOGRAM_SUB_BUCKETS + sub_bucket] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    @staticmethod
+    def _upper_bound(index):
+        """Return upper bound of bucket in seconds."""
+        exponent, sub_bucket = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        mantissa = 0.5 + (sub_bucket + 1) / (2.0 * HISTOGRAM_SUB_BUCKETS)
+        return math.ldexp(mantissa, exponent) * HISTOGRAM_UNIT
+
+    def percentile(self, percent):
+        """Return duration below which given percent of values fall or
+        ``None`` if nothing recorded.
+
+        """
+        if not self.count:
+            return None
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(self._upper_bound(index), self.max)
+        return self.max  # pragma: nocover
+
+
+class RollingPercentile(object):
+    """Percentile of durations over last complete window of samples, used
+    to decide when request should be hedged.
+
+    """
+
+    def __init__(self, percent, window=1000, min_samples=20):
+        self.percent = percent
+        self.window = window
+        self.min_samples = min_samples
+        self._current = Histogram()
+        self._value = None
+
+    @property
+    def value(self):
+        """Current percentile or ``None`` if there are not enough samples."""
+        if self._value is None and self._current.count >= self.min_samples:
+            return self._current.percentile(self.percent)
+        return self._value
+
+    def record(self, value):
+        self._current.record(value)
+        if self._current.count >= self.window:
+            self._value = self._current.percentile(self.percent)
+            self._current = Histogram()
+
+
+class Window(object):
+    """Durations recorded during one statistics window."""
+
+    def __init__(self, started):
+        self.started = started
+        self.finished = None
+        self.commands = defaultdict(Histogram)
+        self.loop_lag = Histogram()
+
+
+class ServerStats(object):
+    """Server statistics in format of STATS reply.
+
+    Server should update ``clients``, ``bytes_in`` and ``bytes_out`` itself,
+    call :meth:`record` after each command and :meth:`record_lag` from
+    periodic timer with difference between expected and actual time of call.
+    Rates and percentiles are computed over last complete window.
+
+    """
+
+    def __init__(self, window=STATS_WINDOW, clock=time.time):
+        self.window = window
+        self._clock = clock
+        self.started = clock()
+        self.clients = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.calls = defaultdict(int)
+        self._current = Window(self.started)
+        self._previous = None
+
+    def _rotate(self):
+        """Start new window if current one is over."""
+        now = self._clock()
+        if now - self._current.started >= self.window:
+            self._current.finished = now
+            self._previous = self._current
+            self._current = Window(now)
+        return now
+
+    def record(self, command, duration):
+        """Record service time of command in seconds."""
+        self._rotate()
+        self.calls[command] += 1
+        self._current.commands[command].record(duration)
+
+    def record_lag(self, lag):
+        """Record event loop lag in seconds."""
+        self._rotate()
+        self._current.loop_lag.record(lag)
+
+    def snapshot(self, **extra):
+        """Return statistics as dictionary, ``extra`` (e.g. ``keys`` and
+        ``memory``) is added as is.
+
+        """
+        now = self._rotate()
+        window = self._previous or self._current
+        elapsed = max((window.finished or now) - window.started,
+                      HISTOGRAM_UNIT)
+        commands = {}
+        for command, calls in iteritems(self.calls):
+            histogram = window.commands.get(command) or Histogram()
+            commands[command] = dict(
+                calls=calls,
+                ops=histogram.count / elapsed,
+                p50=histogram.percentile(50),
+                p99=histogram.percentile(99),
+            )
+        lag = window.loop_lag
+        result = dict(
+            uptime=now - self.started,
+            clients=self.clients,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            commands=commands,
+            loop_lag=dict(p50=lag.percentile(50), p99=lag.percentile(99),
+                          max=lag.max),
+        )
+        result.update(extra)
+        return result
+
+
+def _metric(lines, name, value, **labels):
+    if value is None:
+        return
+    if labels:
+        name += '{' + ','.join('{0}="{1}"'.format(k, v)
+                               for k, v in sorted(iteritems(labels))) + '}'
+    lines.append('speicher_{0} {1}'.format(name, value))
+
+
+def format_metrics(stats):
+    """Render statistics returned by STATS command as plain text, one
+    metric per line, so it can be served to local scraper.
+
+    """
+    lines = []
+    for name in ('uptime', 'clients', 'bytes_in', 'bytes_out', 'keys'):
+        _metric(lines, name, stats.get(name))
+    for kind, value in sorted(iteritems(stats.get('memory') or {})):
+        _metric(lines, 'memory_bytes', value, kind=kind)
+    for quantile, value in sorted(iteritems(stats.get('loop_lag') or {})):
+        _metric(lines, 'loop_lag_seconds', value, quantile=quantile)
+    for command, values in sorted(iteritems(stats.get('commands') or {})):
+        _metric(lines, 'command_calls', values.get('calls'), command=command)
+        _metric(lines, 'command_ops', values.get('ops'), command=command)
+        for quantile in ('p50', 'p99'):
+            _metric(lines, 'command_seconds', values.get(quantile),
+                    command=command, quantile=quantile)
+    return '\n'.join(lines) + '\n'
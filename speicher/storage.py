@@ -0,0 +1,280 @@
+# coding: utf-8
+"""Storage engines for server implementations. Keys and values are byte
+strings, values are expected to be already encoded JSON.
+
+"""
+from __future__ import absolute_import, unicode_literals, print_function
+
+import sys
+import struct
+from array import array
+
+from six import iteritems
+from six.moves import zip
+
+#: Format of record header: key length and value length.
+HEADER_FORMAT = b'!II'
+
+#: Type code of index arrays (signed long).
+INDEX_TYPECODE = str('l')
+
+#: Marks slot that was never used.
+EMPTY = -1
+
+#: Marks slot of deleted key.
+DELETED = -2
+
+#: Initial number of index slots, should be power of two.
+MIN_CAPACITY = 8
+
+
+class DictStorage(object):
+    """Keep values in plain dictionary."""
+
+    def __init__(self):
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return value of given key or ``None`` if key not found."""
+        return self._data.get(key)
+
+    def set(self, key, value):
+        """Store value with given key."""
+        self._data[key] = value
+
+    def delete(self, key):
+        """Delete given key, return ``True`` if key existed."""
+        return self._data.pop(key, None) is not None
+
+    def reset(self):
+        """Delete all keys."""
+        self._data = {}
+
+    def items(self):
+        """Iterate over all keys and values."""
+        return iteritems(self._data)
+
+    def memory_usage(self):
+        """Return how many bytes used by keys and values. Walks over all
+        entries, so it is slow for large storage.
+
+        """
+        keys = values = 0
+        for key, value in iteritems(self._data):
+            keys += sys.getsizeof(key)
+            values += sys.getsizeof(value)
+        return dict(index=sys.getsizeof(self._data), keys=keys, values=values)
+
+
+class CompactStorage(object):
+    """Keep keys and values in two arena-allocated byte arrays with
+    open-addressing index of record offsets.
+
+    Each record in arena is a header followed by key and value. Index is a
+    pair of arrays with record reference (offset and arena number) and hash
+    of key for every slot. Deleted or overwritten records are left in arena as
+    garbage until compaction moves live records to other arena; compaction is
+    incremental, so server should call :meth:`compact_step` from idle
+    callback of its event loop until it returns ``False``.
+
+    """
+
+    header = struct.Struct(HEADER_FORMAT)
+
+    def __init__(self, compact_ratio=0.5):
+        self.compact_ratio = compact_ratio
+        self.reset()
+
+    def __len__(self):
+        return self._count
+
+    def reset(self):
+        """Delete all keys in O(1) by swapping arenas and index with
+        empty ones.
+
+        """
+        self._arenas = [bytearray(), bytearray()]
+        self._dead = [0, 0]
+        self._current = 0
+        self._cursor = None
+        self._refs = array(INDEX_TYPECODE, [EMPTY]) * MIN_CAPACITY
+        self._hashes = array(INDEX_TYPECODE, [0]) * MIN_CAPACITY
+        self._used = 0
+        self._count = 0
+        self._key_bytes = 0
+        self._value_bytes = 0
+
+    def _record(self, ref):
+        """Return arena, offset, key length and value length of record."""
+        arena = self._arenas[ref & 1]
+        offset = ref >> 1
+        key_length, value_length = self.header.unpack_from(arena, offset)
+        return arena, offset + self.header.size, key_length, value_length
+
+    def _lookup(self, key, key_hash):
+        """Return index of slot holding given key or index of slot where key
+        should be inserted and flag if key was found.
+
+        """
+        refs, hashes = self._refs, self._hashes
+        mask = len(refs) - 1
+        i = key_hash & mask
+        free = None
+        while True:
+            ref = refs[i]
+            if ref == EMPTY:
+                return (i if free is None else free), False
+            if ref == DELETED:
+                if free is None:
+                    free = i
+            elif hashes[i] == key_hash:
+                arena, start, key_length, _ = self._record(ref)
+                if arena[start:start + key_length] == key:
+                    return i, True
+            i = (i + 1) & mask
+
+    def _append(self, key, value):
+        """Append record to current arena and return reference to it."""
+        arena = self._arenas[self._current]
+        offset = len(arena)
+        arena += self.header.pack(len(key), len(value))
+        arena += key
+        arena += value
+        self._key_bytes += len(key)
+        self._value_bytes += len(value)
+        return (offset << 1) | self._current
+
+    def _release(self, ref):
+        """Account record as garbage."""
+        _, _, key_length, value_length = self._record(ref)
+        self._dead[ref & 1] += self.header.size + key_length + value_length
+        self._key_bytes -= key_length
+        self._value_bytes -= value_length
+
+    def _resize(self):
+        """Rebuild index with enough capacity, dropping deleted slots."""
+        capacity = MIN_CAPACITY
+        while capacity < self._count * 2:
+            capacity <<= 1
+        refs = array(INDEX_TYPECODE, [EMPTY]) * capacity
+        hashes = array(INDEX_TYPECODE, [0]) * capacity
+        mask = capacity - 1
+        for ref, key_hash in zip(self._refs, self._hashes):
+            if ref < 0:
+                continue
+            i = key_hash & mask
+            while refs[i] != EMPTY:
+                i = (i + 1) & mask
+            refs[i] = ref
+            hashes[i] = key_hash
+        self._refs, self._hashes = refs, hashes
+        self._used = self._count
+        if self._cursor is not None:
+            # slots moved, so walk whole index again
+            self._cursor = 0
+
+    def get(self, key):
+        """Return value of given key or ``None`` if key not found."""
+        i, found = self._lookup(key, hash(key))
+        if not found:
+            return None
+        arena, start, key_length, value_length = self._record(self._refs[i])
+        start += key_length
+        return bytes(arena[start:start + value_length])
+
+    def set(self, key, value):
+        """Store value with given key. Value with same length is
+        overwritten in place.
+
+        """
+        key_hash = hash(key)
+        i, found = self._lookup(key, key_hash)
+        if found:
+            ref = self._refs[i]
+            arena, start, key_length, value_length = self._record(ref)
+            if value_length == len(value):
+                start += key_length
+                arena[start:start + value_length] = value
+                return
+            self._release(ref)
+        else:
+            if self._refs[i] == EMPTY:
+                self._used += 1
+            self._count += 1
+        self._refs[i] = self._append(key, value)
+        self._hashes[i] = key_hash
+        if self._used * 3 >= len(self._refs) * 2:
+            self._resize()
+
+    def delete(self, key):
+        """Delete given key, return ``True`` if key existed."""
+        i, found = self._lookup(key, hash(key))
+        if not found:
+            return False
+        self._release(self._refs[i])
+        self._refs[i] = DELETED
+        self._count -= 1
+        return True
+
+    def items(self):
+        """Iterate over all keys and values."""
+        for ref in self._refs:
+            if ref < 0:
+                continue
+            arena, start, key_length, value_length = self._record(ref)
+            end = start + key_length
+            yield bytes(arena[start:end]), bytes(arena[end:end + value_length])
+
+    @property
+    def needs_compaction(self):
+        """Is there enough garbage in arenas to start compaction?"""
+        if self._cursor is not None:
+            return True
+        dead = sum(self._dead)
+        live = sum(map(len, self._arenas)) - dead
+        return dead > 0 and dead >= live * self.compact_ratio
+
+    def compact_step(self, limit=1000):
+        """Move live records of at most ``limit`` index slots to other arena.
+        Return ``True`` if compaction is not finished yet.
+
+        """
+        if self._cursor is None:
+            if not self.needs_compaction:
+                return False
+            # new records are appended to other (empty) arena from now
+            self._current ^= 1
+            self._cursor = 0
+        old = self._current ^ 1
+        refs = self._refs
+        end = min(self._cursor + limit, len(refs))
+        for i in range(self._cursor, end):
+            ref = refs[i]
+            if ref < 0 or ref & 1 != old:
+                continue
+            arena, start, key_length, value_length = self._record(ref)
+            end_of_record = start + key_length + value_length
+            start -= self.header.size
+            target = self._arenas[self._current]
+            refs[i] = (len(target) << 1) | self._current
+            target += arena[start:end_of_record]
+        if end < len(refs):
+            self._cursor = end
+            return True
+        self._arenas[old] = bytearray()
+        self._dead[old] = 0
+        self._cursor = None
+        return False
+
+    def memory_usage(self):
+        """Return how many bytes used by live keys and values, by index and
+        arenas, and how many bytes of arenas are garbage.
+
+        """
+        index = sys.getsizeof(self._refs) + sys.getsizeof(self._hashes)
+        arenas = sum(map(sys.getsizeof, self._arenas))
+        return dict(keys=self._key_bytes, values=self._value_bytes,
+                    index=index, arenas=arenas, garbage=sum(self._dead))
@@ -1,15 +1,17 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals, print_function
 
+import random
 import struct
-from io import BytesIO
+from functools import partial
 from threading import Thread
-from collections import defaultdict
+from multiprocessing import Pipe, Process
+from collections import defaultdict, deque
 
 import anyjson
 import pyuv
 
-from ..connection import LENGTH_FORMAT
+from ..connection import LENGTH_FORMAT, RawValue
 
 
 class Relay(object):
@@ -84,43 +86,68 @@ class Relay(object):
 
 class Packet(object):
 
+    length_size = struct.calcsize(LENGTH_FORMAT)
+
     def __init__(self):
-        self.buf = BytesIO()
-        self.length = None
-        self.received = 0
+        self.buf = bytearray()
 
     def feed(self, chunk):
-        if self.length is None:
-            self.length = struct.unpack(LENGTH_FORMAT, chunk[:4])[0]
-            assert self.length > 0
-            chunk = chunk[4:]
-        if chunk:
-            self.buf.write(chunk)
-            self.received += len(chunk)
+        self.buf.extend(chunk)
+
+    def frames(self):
+        """Yield payloads of all complete frames in buffer."""
+        while len(self.buf) >= self.length_size:
+            length = struct.unpack_from(LENGTH_FORMAT, self.buf)[0]
+            assert length > 0
+            end = self.length_size + length
+            if len(self.buf) < end:
+                break
+            payload = bytes(self.buf[self.length_size:end])
+            del self.buf[:end]
+            yield payload
+
+    def __iter__(self):
+        """Yield decoded values of all complete frames in buffer."""
+        for payload in self.frames():
+            yield anyjson.deserialize(payload)
+
 
-    @property
-    def ready(self):
-        return self.length is not None and self.received == self.length
+class Frames(list):
+    """Several packets that should be sent in reply to one packet."""
 
-    @property
-    def value(self):
-        return anyjson.deserialize(self.buf.getvalue())
 
-    def reset(self):
-        self.buf = BytesIO()
-        self.length = None
-        self.received = 0
+class Stream(Frames):
+    """Frames followed by packets that callback sends later with
+    :meth:`send`, e.g. replication stream.
+
+    """
+
+    def __init__(self, frames=()):
+        super(Stream, self).__init__(frames)
+        self.write = None
+
+    def send(self, data):
+        """Send packet to client if it is still connected."""
+        if self.write is not None:
+            self.write(data)
 
 
 class FramedRelay(Relay):
-    """Relay that properly decode each received packet."""
+    """Relay that properly decode each received packet. No reply is sent
+    for packets with ``noreply`` flag, all items of :class:`Frames` are sent
+    as separate packets, :class:`~speicher.connection.RawValue` is sent as is.
+
+    """
 
     def __init__(self, callback=None):
         super(FramedRelay, self).__init__(callback)
         self._packets = defaultdict(Packet)
 
     def _encode(self, data):
-        payload = anyjson.serialize(data)
+        if isinstance(data, RawValue):
+            payload = data
+        else:
+            payload = anyjson.serialize(data)
         return struct.pack(LENGTH_FORMAT, len(payload)) + payload
 
     def _close(self, client):
@@ -130,7 +157,126 @@ class FramedRelay(Relay):
     def _process(self, client, data):
         packet = self._packets[client]
         packet.feed(data)
-        if packet.ready:
-            reply = self.callback(packet.value)
-            client.write(self._encode(reply))
-            packet.reset()
+        for value in packet:
+            reply = self.callback(value)
+            if isinstance(value, dict) and value.get(b'noreply'):
+                continue
+            if not isinstance(reply, Frames):
+                reply = [reply]
+            client.write(b''.join(map(self._encode, reply)))
+            if isinstance(reply, Stream):
+                reply.write = partial(self._send, client)
+
+    def _send(self, client, data):
+        if not client.closed:
+            client.write(self._encode(data))
+
+
+#: Close connection instead of reply.
+FAULT_DROP = 'drop'
+
+
+def random_fault(delay=0.0, delay_rate=0.0, drop_rate=0.0):
+    """Create fault function that delays reply by ``delay`` seconds with
+    probability ``delay_rate`` or drops connection with probability
+    ``drop_rate``.
+
+    """
+    def fault(request):
+        chance = random.random()
+        if chance < drop_rate:
+            return FAULT_DROP
+        if chance < drop_rate + delay_rate:
+            return delay
+        return None
+    return fault
+
+
+class FaultyRelay(FramedRelay):
+    """Relay that injects faults. For each request ``fault`` callback returns
+    ``None``, :data:`FAULT_DROP` or delay of reply in seconds. Replies that
+    follow delayed one wait for it, so order of replies is kept.
+
+    """
+
+    def __init__(self, callback=None, fault=None):
+        super(FaultyRelay, self).__init__(callback)
+        self.fault = fault if fault is not None else lambda request: None
+        self._timers = set()
+        self._delayed = defaultdict(deque)
+
+    def _flush(self, client):
+        """Write replies from head of queue that are ready."""
+        queue = self._delayed.get(client)
+        while queue and queue[0][1]:
+            chunk = queue.popleft()[0]
+            if not client.closed:
+                client.write(chunk)
+
+    def _write_later(self, client, entry, delay):
+        def on_timer(timer):
+            self._timers.discard(timer)
+            timer.close()
+            entry[1] = True
+            self._flush(client)
+        # keep reference, otherwise timer is collected before it fires
+        timer = pyuv.Timer(self._loop)
+        self._timers.add(timer)
+        timer.start(on_timer, delay, 0)
+
+    def _close(self, client):
+        self._delayed.pop(client, None)
+        super(FaultyRelay, self)._close(client)
+
+    def _on_signal(self, handle):
+        for timer in self._timers:
+            timer.close()
+        self._timers.clear()
+        super(FaultyRelay, self)._on_signal(handle)
+
+    def _process(self, client, data):
+        packet = self._packets[client]
+        packet.feed(data)
+        for value in packet:
+            reply = self.callback(value)
+            fault = self.fault(value)
+            if fault == FAULT_DROP:
+                self._close(client)
+                return
+            if isinstance(value, dict) and value.get(b'noreply'):
+                continue
+            chunk = self._encode(reply)
+            queue = self._delayed[client]
+            if fault or queue:
+                # pair of reply and flag if it is ready to be written
+                entry = [chunk, not fault]
+                queue.append(entry)
+                if fault:
+                    self._write_later(client, entry, fault)
+            else:
+                client.write(chunk)
+
+
+def _serve(factory, args, conn):
+    relay = factory(*args)
+    relay.start()
+    conn.send((relay.host, relay.port))
+    conn.recv()
+    relay.stop()
+
+
+class RelayProcess(object):
+    """Relay created by ``factory(*args)`` in separate process."""
+
+    def __init__(self, factory, *args):
+        self._conn, child = Pipe()
+        process = self._process = Process(target=_serve,
+                                          args=(factory, args, child))
+        process.daemon = True
+        process.start()
+        self.host, self.port = self._conn.recv()
+
+    def stop(self):
+        if self._process.is_alive():
+            self._conn.send(None)
+            self._process.join(Relay.timeout)
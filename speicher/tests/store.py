@@ -0,0 +1,129 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+from collections import defaultdict
+
+import anyjson
+
+from .relay import Frames, Stream, FramedRelay
+
+from ..replication import Follower
+from ..storage import DictStorage
+
+
+class Store(object):
+    """In-memory storage, callback of :class:`FramedRelay`. Writes are
+    streamed to replicas that sent SYNC.
+
+    """
+
+    def __init__(self, replication=None):
+        self.data = {}
+        self.replication = replication
+        self.calls = defaultdict(int)
+        self.streams = []
+        self.offset = 0
+
+    def __call__(self, request):
+        command = request.get('command', '')
+        handler = getattr(self, 'on_' + command.lower(), None)
+        if handler is None:
+            return {'status_code': 400}
+        self.calls[command] += 1
+        return handler(request)
+
+    def _replicate(self, command, **kwargs):
+        self.offset += 1
+        frame = dict(status_code=200, command=command, offset=self.offset,
+                     time=time.time(), **kwargs)
+        for stream in self.streams:
+            stream.send(frame)
+
+    def on_set(self, request):
+        self.data[request['key']] = request['value']
+        self._replicate('SET', key=request['key'], value=request['value'])
+        return {'status_code': 200}
+
+    def on_get(self, request):
+        if request['key'] not in self.data:
+            return {'status_code': 404}
+        return {'status_code': 200, 'value': self.data[request['key']]}
+
+    def on_del(self, request):
+        if self.data.pop(request['key'], None) is None:
+            return {'status_code': 404}
+        self._replicate('DEL', key=request['key'])
+        return {'status_code': 200}
+
+    def on_rst(self, request):
+        self.data.clear()
+        self._replicate('RST')
+        return {'status_code': 200}
+
+    def _batches(self, frames, size):
+        entries = sorted(self.data.items())
+        frames.extend({'status_code': 200, 'entries': entries[i:i + size]}
+                      for i in range(0, len(entries), size))
+        return frames
+
+    def on_dump(self, request):
+        frames = self._batches(Frames(), request['batch_size'])
+        frames.append({'status_code': 200, 'entries': [], 'done': True})
+        return frames
+
+    def on_sync(self, request):
+        stream = self._batches(Stream(), request['batch_size'])
+        stream.append({'status_code': 200, 'entries': [], 'done': True,
+                       'offset': self.offset, 'time': time.time()})
+        self.streams.append(stream)
+        return stream
+
+    def on_restore(self, request):
+        self.data.update(request['entries'])
+        return {'status_code': 200}
+
+    def on_stats(self, request):
+        stats = {'keys': len(self.data),
+                 'commands': dict((command, {'calls': calls}) for
+                                  command, calls in self.calls.items())}
+        if self.replication is not None:
+            stats['replication'] = self.replication
+        return {'status_code': 200, 'stats': stats}
+
+
+class ReplicaStore(Store):
+    """Replica that serves GET from storage kept in sync with primary by
+    :class:`~speicher.replication.Follower` and reports its lag in STATS.
+
+    """
+
+    def __init__(self, follower):
+        super(ReplicaStore, self).__init__()
+        self.follower = follower
+
+    def on_stats(self, request):
+        reply = super(ReplicaStore, self).on_stats(request)
+        reply['stats'].update(
+            keys=len(self.follower.storage),
+            replication={'lag': self.follower.lag,
+                         'offset': self.follower.offset})
+        return reply
+
+    def on_get(self, request):
+        value = self.follower.storage.get(request['key'].encode('utf-8'))
+        if value is None:
+            return {'status_code': 404}
+        return {'status_code': 200, 'value': anyjson.deserialize(value)}
+
+
+def primary_relay():
+    """Create relay of primary server."""
+    return FramedRelay(Store())
+
+
+def replica_relay(host, port):
+    """Create relay of replica that follows given primary."""
+    follower = Follower(host, port, DictStorage(), retry_delay=0.05)
+    follower.start()
+    return FramedRelay(ReplicaStore(follower))
@@ -1,23 +1,32 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals, print_function
 
+import time
+from threading import Event, Thread
+
 from .base import TestCase
-from .relay import FramedRelay
+from .relay import FramedRelay, FaultyRelay, Frames, FAULT_DROP
 
 from ..client import Speicher
-from ..exceptions import ServerError, MalformedReply
+from ..connection import RawValue
+from ..exceptions import (
+    ServerError, ClientError, MalformedReply, ConnectionError, TimeoutError)
 
 
 class ClientTest(TestCase):
 
-    def create_relay(self, **kwargs):
-        relay = self.relay = FramedRelay(**kwargs)
+    def create_relay(self, relay_class=FramedRelay, **kwargs):
+        relay = self.relay = relay_class(**kwargs)
         self.addCleanup(relay.stop)
         relay.start()
         return (relay.host, relay.port)
 
-    def create_client(self, callback=None, **kwargs):
-        host, port = self.create_relay(callback=callback)
+    def create_client(self, callback=None, fault=None, **kwargs):
+        if fault is None:
+            host, port = self.create_relay(callback=callback)
+        else:
+            host, port = self.create_relay(
+                FaultyRelay, callback=callback, fault=fault)
         client = Speicher(host=host, port=port, **kwargs)
         self.addCleanup(client.close)
         return client
@@ -93,6 +102,15 @@ class ClientTest(TestCase):
         client = self.create_client(inner_cb)
         self.assertIsNone(client.set('foo', 'bar'))
 
+    def test_set_raw(self):
+        def inner_cb(data):
+            self.assertEqual(b'SET', data[b'command'])
+            self.assertEqual(b'foo', data[b'key'])
+            self.assertEqual(['b', 'a', 'r'], data[b'value'])
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb)
+        self.assertIsNone(client.set('foo', RawValue(b'["b", "a", "r"]')))
+
     def test_set_none(self):
         def inner_cb(data):
             self.assertEqual(b'DEL', data[b'command'])
@@ -123,3 +141,276 @@ class ClientTest(TestCase):
             return {b'status_code': 200}
         client = self.create_client(inner_cb)
         self.assertIsNone(client.reset())
+
+    def test_dump(self):
+        def inner_cb(data):
+            self.assertEqual(b'DUMP', data[b'command'])
+            self.assertEqual(2, data[b'batch_size'])
+            return Frames([
+                {b'status_code': 200, b'entries': [['a', 1], ['b', 2]]},
+                {b'status_code': 200, b'entries': [['c', 3]], b'done': True},
+            ])
+        client = self.create_client(inner_cb)
+        self.assertEqual([('a', 1), ('b', 2), ('c', 3)],
+                         list(client.dump(batch_size=2)))
+
+    def test_dump_raw(self):
+        def inner_cb(data):
+            return {b'status_code': 200, b'entries': [['a', {'b': [1]}]],
+                    b'done': True}
+        client = self.create_client(inner_cb)
+        entries = list(client.dump(raw=True))
+        self.assertEqual([('a', b'{"b": [1]}')], entries)
+        self.assertIsInstance(entries[0][1], RawValue)
+
+    def test_dump_interrupted(self):
+        def inner_cb(data):
+            return Frames([{b'status_code': 200, b'entries': [['a', 1]]}] * 3)
+        client = self.create_client(inner_cb)
+        entries = client.dump()
+        self.assertEqual(('a', 1), next(entries))
+        entries.close()
+        self.assertIsNone(client._conn._sock)
+
+    def test_dump_malformed(self):
+        def inner_cb(data):
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb)
+        with self.assertRaises(MalformedReply):
+            list(client.dump())
+
+    def test_restore(self):
+        received = []
+
+        def inner_cb(data):
+            self.assertEqual(b'RESTORE', data[b'command'])
+            received.append(data[b'entries'])
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb)
+        entries = [('a', 1), (b'b', RawValue(b'[2]')), ('c', 'x')]
+        self.assertEqual(3, client.restore(entries, batch_size=2, window=1))
+        self.assertEqual([[['a', 1], ['b', [2]]], [['c', 'x']]], received)
+
+    def test_restore_error(self):
+        received = []
+
+        def inner_cb(data):
+            if data[b'command'] == b'GET':
+                return {b'status_code': 200, b'value': 'bar'}
+            received.append(data)
+            return {b'status_code': 400 if len(received) == 1 else 200}
+        client = self.create_client(inner_cb)
+        entries = [('a', 1), ('b', 2), ('c', 3)]
+        with self.assertRaises(ClientError):
+            client.restore(entries, batch_size=1)
+        self.assertIsNone(client._conn._sock)
+        self.assertEqual('bar', client.get('foo'))
+
+    def test_bulk_timeout(self):
+        def inner_cb(data):
+            return {b'status_code': 200, b'entries': [['a', 1]]}
+        client = self.create_client(inner_cb, fault=lambda request: 1.0)
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            list(client.dump(timeout=0.05))
+        with self.assertRaises(TimeoutError):
+            client.restore([('a', 1)], timeout=0.05)
+        self.assertLess(time.time() - started, 0.5)
+        self.assertIsNone(client._conn._sock)
+
+    def test_stats(self):
+        def inner_cb(data):
+            self.assertEqual(b'STATS', data[b'command'])
+            return {b'status_code': 200, b'stats': {b'keys': 1}}
+        client = self.create_client(inner_cb)
+        self.assertEqual({'keys': 1}, client.stats())
+
+    def test_stats_malformed(self):
+        def inner_cb(data):
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb)
+        with self.assertRaises(MalformedReply):
+            client.stats()
+
+    def test_set_noreply(self):
+        received = []
+
+        def inner_cb(data):
+            received.append(data)
+            return {b'status_code': 200, b'value': 'bar'}
+        client = self.create_client(inner_cb)
+        self.assertIsNone(client.set('foo', 'bar', noreply=True))
+        self.assertEqual('bar', client.get('foo'))
+        self.assertEqual(2, len(received))
+        self.assertEqual(b'SET', received[0][b'command'])
+        self.assertTrue(received[0][b'noreply'])
+        self.assertNotIn(b'noreply', received[1])
+
+    def test_delete_noreply(self):
+        received = []
+
+        def inner_cb(data):
+            received.append(data)
+            return {b'status_code': 404}
+        client = self.create_client(inner_cb)
+        self.assertIsNone(client.delete('foo', noreply=True))
+        self.assertIsNone(client.set('foo', None, noreply=True))
+        self.assertFalse(client.delete('foo'))
+        self.assertEqual([b'DEL'] * 3, [d[b'command'] for d in received])
+        self.assertTrue(received[0][b'noreply'])
+        self.assertTrue(received[1][b'noreply'])
+
+    def test_write_behind(self):
+        received = []
+        done = Event()
+
+        def inner_cb(data):
+            received.append(data)
+            if len(received) == 3:
+                done.set()
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb, write_behind=True)
+        self.assertIsNone(client.set('foo', 'bar'))
+        self.assertIsNone(client.set('foo', None))
+        self.assertIsNone(client.delete('bar'))
+        client.flush()
+        self.assertTrue(done.wait(self.relay.timeout))
+        self.assertEqual(
+            [b'SET', b'DEL', b'DEL'], [d[b'command'] for d in received])
+        self.assertTrue(all(d[b'noreply'] for d in received))
+        self.assertEqual(3, client.write_queue.sent)
+        client.close()
+        self.assertEqual(0, len(client.write_queue))
+
+    def test_write_behind_reset(self):
+        received = []
+
+        def inner_cb(data):
+            received.append(data)
+            return {b'status_code': 200}
+        client = self.create_client(inner_cb, write_behind=True)
+        client.set('foo', 'bar')
+        client.delete('bar')
+        self.assertIsNone(client.reset())
+        self.assertEqual(
+            [b'SET', b'DEL', b'RST'], [d[b'command'] for d in received])
+        # RST doesn't use main connection
+        self.assertIsNone(client._conn._sock)
+
+    def test_write_behind_reset_doesnt_block(self):
+        received = []
+        reset = Event()
+
+        def inner_cb(data):
+            received.append(data[b'command'])
+            if data[b'command'] == b'RST':
+                reset.set()
+            return {b'status_code': 200}
+
+        def fault(request):
+            return 0.3 if request[b'command'] == b'RST' else None
+        client = self.create_client(inner_cb, fault, write_behind=True)
+        client.set('foo', 'bar')
+        thread = Thread(target=client.reset)
+        thread.start()
+        self.assertTrue(reset.wait(self.relay.timeout))
+        started = time.time()
+        client.set('foo', 'baz')
+        self.assertLess(time.time() - started, 0.1)
+        thread.join()
+        client.flush()
+        client.close()
+        self.assertEqual([b'SET', b'RST', b'SET'], received)
+
+    def faults(self, *faults):
+        """Create fault function that returns given faults one by one."""
+        faults = list(faults)
+        return lambda request: faults.pop(0) if faults else None
+
+    def test_socket_options(self):
+        client = self.create_client(write_behind=True, hedge=True,
+                                    connect_timeout=0.5, nodelay=False,
+                                    keepalive=5)
+        for conn in (client._conn, client._hedge_conn,
+                     client.write_queue._conn):
+            self.assertEqual((0.5, False, 5),
+                             (conn.connect_timeout, conn.nodelay,
+                              conn.keepalive))
+
+    def test_get_retry(self):
+        received = []
+
+        def inner_cb(data):
+            received.append(data)
+            return {b'status_code': 200, b'value': 'bar'}
+        client = self.create_client(
+            inner_cb, self.faults(FAULT_DROP, FAULT_DROP), retries=2)
+        self.assertEqual('bar', client.get('foo'))
+        self.assertEqual(3, len(received))
+
+    def test_get_retry_exhausted(self):
+        def inner_cb(data):
+            return {b'status_code': 200, b'value': 'bar'}
+        client = self.create_client(
+            inner_cb, lambda request: FAULT_DROP, retries=1)
+        with self.assertRaises(ConnectionError):
+            client.get('foo')
+
+    def test_get_deadline(self):
+        def inner_cb(data):
+            return {b'status_code': 200, b'value': 'bar'}
+        client = self.create_client(
+            inner_cb, lambda request: 1.0, retries=5)
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            client.get('foo', timeout=0.05)
+        self.assertLess(time.time() - started, 0.5)
+
+    def test_hedge(self):
+        def inner_cb(data):
+            return {b'status_code': 200, b'value': 'bar'}
+        # hedging starts after 20 GETs measured
+        warmup = [None] * 20
+        client = self.create_client(
+            inner_cb, self.faults(*(warmup + [1.0])), hedge=True)
+        for _ in warmup:
+            self.assertEqual('bar', client.get('foo'))
+        self.assertEqual(0, client.hedged)
+        started = time.time()
+        self.assertEqual('bar', client.get('foo'))
+        self.assertLess(time.time() - started, 0.5)
+        self.assertEqual(1, client.hedged)
+        # connection that lost the race is kept
+        self.assertIsNotNone(client._conn._sock)
+        self.assertIsNotNone(client._hedge_conn._sock)
+        self.assertEqual(1, client._hedge_conn.stale)
+        self.assertEqual('bar', client.get('foo'))
+
+    def test_hedge_stale_reply(self):
+        values = iter(range(100))
+
+        def inner_cb(data):
+            return {b'status_code': 200, b'value': next(values)}
+        warmup = [None] * 20
+        client = self.create_client(
+            inner_cb, self.faults(*(warmup + [0.05, None, None, 0.05])),
+            hedge=True)
+        for i in range(20):
+            self.assertEqual(i, client.get('foo'))
+        # first GET is delayed, hedge over other connection wins
+        self.assertEqual(21, client.get('foo'))
+        self.assertEqual(1, client._hedge_conn.stale)
+        sock = client._hedge_conn._sock
+        time.sleep(0.1)
+        # stale reply has arrived, so it is discarded and connection is kept
+        self.assertEqual(22, client.get('foo'))
+        self.assertIs(sock, client._hedge_conn._sock)
+        self.assertEqual(0, client._hedge_conn.stale)
+        # GET is delayed again, hedge goes over kept connection
+        self.assertEqual(24, client.get('foo'))
+        self.assertEqual(2, client.hedged)
+        # stale reply is still outstanding, so connection is replaced
+        sock = client._hedge_conn._sock
+        self.assertEqual(25, client.get('foo'))
+        self.assertIsNot(sock, client._hedge_conn._sock)
+        self.assertEqual(0, client._hedge_conn.stale)
@@ -1,11 +1,17 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals, print_function
 
+import time
+import socket
+
+import mock
+
 from .base import TestCase
 from .relay import Relay
 
-from ..connection import Connection, MAX_READ_LENGTH
-from ..exceptions import ConnectionError
+from ..connection import (
+    Connection, RawValue, MAX_READ_LENGTH, decode_raw_entries)
+from ..exceptions import ConnectionError, TimeoutError
 
 
 class ConnectionTest(TestCase):
@@ -56,3 +62,94 @@ class ConnectionTest(TestCase):
         c = self.create_connection()
         c.send(big_fat_string)
         self.assertEqual(big_fat_string, c.read())
+
+    def test_raw_value(self):
+        c = self.create_connection()
+        c.send(dict(key='foo', value=RawValue(b'{"a": [1, 2]}')))
+        self.assertEqual(dict(key='foo', value={'a': [1, 2]}), c.read())
+        c.send(dict(value=RawValue(b'"bar"')))
+        self.assertEqual(dict(value='bar'), c.read())
+
+    def test_deadline(self):
+        c = self.create_connection()
+        c.send(dict(test=1))
+        with self.assertRaises(TimeoutError):
+            c.read(deadline=time.time() - 1.0)
+        self.assertIsNone(c._sock)
+        with self.assertRaises(TimeoutError):
+            c.send(dict(test=1), deadline=time.time() - 1.0)
+
+    def test_slow_reply(self):
+        relay = Relay(callback=lambda d: None)
+        self.addCleanup(relay.stop)
+        relay.start()
+        c = self.create_connection(port=relay.port)
+        c.send(dict(test=1))
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            c.read(deadline=started + 0.05)
+        self.assertLess(time.time() - started, 1.0)
+
+    def test_socket_options(self):
+        c = self.create_connection(keepalive=5)
+        self.assertEqual(c.timeout, c.connect_timeout)
+        c.connect()
+        self.assertTrue(
+            c._sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(
+            c._sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        c = self.create_connection(connect_timeout=0.5, nodelay=False)
+        self.assertEqual(0.5, c.connect_timeout)
+        c.connect()
+        self.assertFalse(
+            c._sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+    def test_reconnect_backoff(self):
+        c = self.create_connection(host='127.1.2.3', port=65434,
+                                   backoff=10.0, max_backoff=15.0)
+        with mock.patch('speicher.connection.random.uniform',
+                        side_effect=lambda a, b: b):
+            with self.assertRaises(ConnectionError):
+                c.connect()
+            self.assertAlmostEqual(10.0, c.retry_delay, delta=1.0)
+            with mock.patch.object(c, '_create_connection') as create:
+                with self.assertRaises(ConnectionError):
+                    c.connect()
+                self.assertFalse(create.called)
+            c._retry_at = 0.0
+            with self.assertRaises(ConnectionError):
+                c.connect()
+            self.assertAlmostEqual(15.0, c.retry_delay, delta=1.0)
+
+    def test_reconnect_without_backoff(self):
+        c = self.create_connection(host='127.1.2.3', port=65434)
+        with self.assertRaises(ConnectionError):
+            c.connect()
+        self.assertEqual(0.0, c.retry_delay)
+        with mock.patch.object(c, '_create_connection') as create:
+            c.connect()
+            self.assertTrue(create.called)
+
+
+class DecodeRawEntriesTest(TestCase):
+
+    def test_decode(self):
+        payload = ' { "status_code" : 200 , "entries" : [ [ "a" , {"b": [1, "]"]} ],' \
+                  '["\u043a\\"", "\u0437"], ["c",null]], "done": true } '
+        data = decode_raw_entries(payload.encode('utf-8'))
+        self.assertEqual(200, data['status_code'])
+        self.assertTrue(data['done'])
+        self.assertEqual([('a', b'{"b": [1, "]"]}'),
+                          ('\u043a"', '"\u0437"'.encode('utf-8')),
+                          ('c', b'null')], data['entries'])
+        self.assertTrue(all(isinstance(value, RawValue)
+                            for _, value in data['entries']))
+
+    def test_empty(self):
+        self.assertEqual({'entries': []},
+                         decode_raw_entries(b'{"entries": []}'))
+
+    def test_broken(self):
+        for payload in (b'{"entries": [["a", 1]', b'{"entries": [["a", }'):
+            with self.assertRaises(ValueError):
+                decode_raw_entries(payload)
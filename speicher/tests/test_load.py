@@ -0,0 +1,124 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+import mock
+
+from .base import TestCase
+from .relay import FramedRelay
+from .store import Store
+
+from ..connection import RawValue, encode_entries
+from ..load import (main, Progress, read_binary, write_binary,
+                    read_jsonl, write_jsonl)
+
+ENTRIES = [
+    ('bar', {'a': [1, 2]}),
+    ('foo', 'bar'),
+    ('ключ', None),
+]
+
+
+class FormatTest(TestCase):
+
+    def test_jsonl(self):
+        stream = BytesIO()
+        write_jsonl(ENTRIES, stream)
+        self.assertEqual(3, stream.getvalue().count(b'\n'))
+        stream.seek(0)
+        self.assertEqual(ENTRIES, list(read_jsonl(stream)))
+
+    def test_binary(self):
+        stream = BytesIO()
+        write_binary(ENTRIES, stream)
+        stream.seek(0)
+        entries = list(read_binary(stream))
+        self.assertEqual([key.encode('utf-8') for key, _ in ENTRIES],
+                         [key for key, _ in entries])
+        self.assertEqual([b'{"a": [1, 2]}', b'"bar"', b'null'],
+                         [value for _, value in entries])
+
+    def test_binary_broken(self):
+        with self.assertRaises(ValueError):
+            list(read_binary(BytesIO(b'garbage')))
+        stream = BytesIO()
+        write_binary(ENTRIES, stream)
+        with self.assertRaises(ValueError):
+            list(read_binary(BytesIO(stream.getvalue()[:-1])))
+
+    def test_progress(self):
+        now = [0.0]
+        stream = StringIO()
+        progress = Progress('export', stream, interval=1.0,
+                            clock=lambda: now[0])
+        for _ in progress.wrap(range(3)):
+            now[0] += 0.5
+        self.assertEqual('export: 2 entries, 2/s\n', stream.getvalue())
+        progress.finish()
+        self.assertEqual(3, progress.count)
+
+
+class LoadTest(TestCase):
+
+    def create_server(self, data=None):
+        store = Store()
+        store.data.update(data or {})
+        relay = FramedRelay(store)
+        self.addCleanup(relay.stop)
+        relay.start()
+        return store, relay.port
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.data = dict(('key{0}'.format(i), [i, 'value']) for i in range(25))
+        self.source, self.source_port = self.create_server(self.data)
+
+    def run_main(self, *args):
+        return main(['--host', '127.0.0.1', '--port', str(self.source_port),
+                     '--batch-size', '10', '--quiet'] + list(args))
+
+    def test_export_binary_raw(self):
+        path = os.path.join(self.tmp, 'dump.bin')
+        with mock.patch('speicher.load.anyjson') as json:
+            self.assertEqual(0, self.run_main('export', path))
+        self.assertFalse(json.serialize.called)
+        with open(path, 'rb') as f:
+            entries = dict(read_binary(f))
+        self.assertEqual(b'[0, "value"]', entries[b'key0'])
+
+    def test_export_import(self):
+        for name in ('dump.jsonl', 'dump.bin'):
+            path = os.path.join(self.tmp, name)
+            self.assertEqual(0, self.run_main('export', path))
+            self.source.data['extra'] = 1
+            self.assertEqual(0, self.run_main('import', '--reset', path))
+            self.assertEqual(self.data, self.source.data)
+
+    def test_copy(self):
+        target, port = self.create_server({'old': 1})
+        with mock.patch('speicher.client.encode_entries',
+                        side_effect=encode_entries) as encode:
+            self.assertEqual(0, self.run_main(
+                'copy', '--to-host', '127.0.0.1', '--to-port', str(port)))
+        # values are passed through as received
+        values = [value for call in encode.call_args_list
+                  for _, value in call[0][0]]
+        self.assertEqual(25, len(values))
+        self.assertTrue(all(isinstance(value, RawValue) for value in values))
+        self.data['old'] = 1
+        self.assertEqual(self.data, target.data)
+
+    def test_error(self):
+        path = os.path.join(self.tmp, 'dump.bin')
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+        with mock.patch('sys.stderr') as stderr:
+            with self.assertRaises(SystemExit) as cm:
+                self.run_main('import', path)
+        self.assertTrue(stderr.write.called)
+        self.assertEqual(1, cm.exception.code)
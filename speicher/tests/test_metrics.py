@@ -0,0 +1,41 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import urlopen
+
+from .base import TestCase
+from .relay import FramedRelay
+from .store import Store
+
+from ..metrics import MetricsServer
+
+
+class MetricsServerTest(TestCase):
+
+    def create_server(self, host, port):
+        server = MetricsServer(host, port, timeout=1.0, listen=('127.0.0.1', 0))
+        self.addCleanup(server.stop)
+        server.start()
+        return 'http://{0}:{1}/metrics'.format(*server.address)
+
+    def test_metrics(self):
+        store = Store()
+        store.data['foo'] = 'bar'
+        relay = FramedRelay(store)
+        self.addCleanup(relay.stop)
+        relay.start()
+        url = self.create_server(relay.host, relay.port)
+        response = urlopen(url, timeout=5.0)
+        self.assertEqual(200, response.getcode())
+        self.assertTrue(
+            response.info().get('Content-Type').startswith('text/plain'))
+        self.assertEqual(b'speicher_keys 1\n'
+                         b'speicher_command_calls{command="STATS"} 1\n',
+                         response.read())
+
+    def test_server_down(self):
+        url = self.create_server('127.1.2.3', 65434)
+        with self.assertRaises(HTTPError) as cm:
+            urlopen(url, timeout=5.0)
+        self.assertEqual(503, cm.exception.code)
@@ -0,0 +1,225 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+
+from .base import TestCase
+from .relay import FaultyRelay, FramedRelay, Frames, RelayProcess
+from .store import Store, primary_relay, replica_relay
+
+from ..client import Speicher
+from ..connection import RawValue
+from ..exceptions import MalformedReply
+from ..replication import Follower, ReplicatedSpeicher
+from ..storage import DictStorage
+
+SYNC_FRAMES = [
+    {'status_code': 200, 'entries': [['a', 1], ['b', 2]]},
+    {'status_code': 200, 'entries': [['c', 3]], 'done': True,
+     'offset': 3, 'time': 100.0},
+]
+
+
+class FollowerTest(TestCase):
+
+    def create_follower(self, frames, **kwargs):
+        self.now = 101.5
+        self.syncs = 0
+
+        def inner_cb(data):
+            self.assertEqual(b'SYNC', data[b'command'])
+            self.assertEqual(2, data[b'batch_size'])
+            self.syncs += 1
+            return Frames(SYNC_FRAMES + frames)
+        relay = FramedRelay(inner_cb)
+        self.addCleanup(relay.stop)
+        relay.start()
+        storage = self.storage = DictStorage()
+        storage.set(b'old', b'1')
+        follower = Follower(relay.host, relay.port, storage, batch_size=2,
+                            clock=lambda: self.now, **kwargs)
+        self.addCleanup(follower.stop)
+        return follower
+
+    def test_sync_and_stream(self):
+        follower = self.create_follower([
+            {'status_code': 200, 'command': 'SET', 'key': 'd',
+             'value': [4], 'offset': 4, 'time': 101.0},
+            {'status_code': 200, 'command': 'DEL', 'key': 'a',
+             'offset': 5, 'time': 101.0},
+            {'status_code': 200, 'command': 'PING', 'offset': 5,
+             'time': 101.25},
+            {'status_code': 200, 'command': 'RST', 'offset': 6,
+             'time': 101.25},
+        ])
+        self.assertIsNone(follower.lag)
+        follower.sync()
+        self.assertEqual(3, follower.offset)
+        self.assertEqual(1.5, follower.lag)
+        self.assertEqual({b'a': b'1', b'b': b'2', b'c': b'3'},
+                         dict(self.storage.items()))
+        for _ in range(3):
+            follower.step()
+        self.assertEqual(5, follower.offset)
+        self.assertEqual(0.25, follower.lag)
+        self.assertEqual({b'b': b'2', b'c': b'3', b'd': b'[4]'},
+                         dict(self.storage.items()))
+        follower.step()
+        self.assertEqual(0, len(self.storage))
+
+    def test_dead_stream(self):
+        follower = self.create_follower([])
+        follower.sync()
+        self.now += 2.0
+        self.assertEqual(1.5, follower.lag)
+        self.now += 2.0
+        self.assertIsNone(follower.lag)
+
+    def test_unknown_command(self):
+        follower = self.create_follower([{'status_code': 200, 'command': 'X'}])
+        follower.sync()
+        with self.assertRaises(MalformedReply):
+            follower.step()
+
+    def test_start_stop(self):
+        follower = self.create_follower([], retry_delay=0.01)
+        follower.start()
+        deadline = time.time() + 5.0
+        while not follower.synced and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(follower.synced)
+        follower.stop(timeout=5.0)
+        self.assertFalse(follower._thread.is_alive())
+
+    def test_broken_frame(self):
+        follower = self.create_follower([RawValue(b'{broken')],
+                                        retry_delay=0.01)
+        follower.start()
+        deadline = time.time() + 5.0
+        while self.syncs < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.syncs, 3)
+        self.assertTrue(follower._thread.is_alive())
+
+
+class ReplicatedSpeicherTest(TestCase):
+
+    def create_server(self, value, replication=None, fault=None):
+        store = Store(replication)
+        store.data['foo'] = value
+        relay = FaultyRelay(store, fault)
+        self.addCleanup(relay.stop)
+        relay.start()
+        return store, relay
+
+    def setUp(self):
+        self.now = 0.0
+        self.primary, self.primary_relay = self.create_server('primary')
+        self.first, first = self.create_server('first', {'lag': 0.1})
+        self.second, self.second_relay = self.create_server(
+            'second', {'lag': 0.2})
+        client = self.client = ReplicatedSpeicher(
+            self.primary_relay.host, self.primary_relay.port,
+            replicas=[(first.host, first.port),
+                      (self.second_relay.host, self.second_relay.port)],
+            max_staleness=0.5, clock=lambda: self.now)
+        self.addCleanup(client.close)
+
+    def test_round_robin(self):
+        self.assertEqual(['first', 'second', 'first'],
+                         [self.client.get('foo') for _ in range(3)])
+
+    def test_write_to_primary(self):
+        self.client.set('bar', 1)
+        self.assertEqual({'foo': 'primary', 'bar': 1}, self.primary.data)
+
+    def test_stale_replica(self):
+        self.assertEqual(['first', 'second'],
+                         [self.client.get('foo') for _ in range(2)])
+        self.second.replication['lag'] = 5.0
+        # lag is cached until next check
+        self.assertEqual(['first', 'second'],
+                         [self.client.get('foo') for _ in range(2)])
+        self.now += 1.0
+        self.assertEqual(['first', 'first'],
+                         [self.client.get('foo') for _ in range(2)])
+        self.first.replication['lag'] = None
+        self.now += 1.0
+        self.assertEqual('primary', self.client.get('foo'))
+
+    def test_replica_down(self):
+        self.assertEqual(['first', 'second'],
+                         [self.client.get('foo') for _ in range(2)])
+        self.second_relay.stop()
+        self.assertEqual(['first', 'primary', 'first', 'first'],
+                         [self.client.get('foo') for _ in range(4)])
+
+    def test_replica_options(self):
+        client = ReplicatedSpeicher(
+            self.primary_relay.host, self.primary_relay.port,
+            replicas=[(self.second_relay.host, self.second_relay.port)],
+            nodelay=False, keepalive=5)
+        self.addCleanup(client.close)
+        conn = client.replicas[0].client._conn
+        self.assertEqual((False, 5), (conn.nodelay, conn.keepalive))
+
+    def test_slow_check(self):
+        _, slow = self.create_server(
+            'slow', {'lag': 0.1},
+            fault=lambda r: 1.5 if r['command'] == 'STATS' else None)
+        client = ReplicatedSpeicher(
+            self.primary_relay.host, self.primary_relay.port, timeout=5.0,
+            replicas=[(slow.host, slow.port)], clock=lambda: self.now)
+        self.addCleanup(client.close)
+        started = time.time()
+        self.assertEqual('primary', client.get('foo', timeout=0.05))
+        self.assertLess(time.time() - started, 0.5)
+        self.assertIsNone(client.replicas[0].lag)
+
+
+class ReplicationProcessTest(TestCase):
+    """Primary and replica, each in its own process."""
+
+    def start(self, factory, *args):
+        process = RelayProcess(factory, *args)
+        self.addCleanup(process.stop)
+        return process
+
+    def wait(self, predicate, timeout=5.0):
+        deadline = time.time() + timeout
+        while not predicate() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(predicate())
+
+    def test_replication(self):
+        primary = self.start(primary_relay)
+        client = Speicher(primary.host, primary.port)
+        self.addCleanup(client.close)
+        client.set('foo', 'before sync')
+        replica = self.start(replica_relay, primary.host, primary.port)
+        client = ReplicatedSpeicher(
+            primary.host, primary.port,
+            replicas=[(replica.host, replica.port)],
+            max_staleness=0.5, check_interval=0.0)
+        self.addCleanup(client.close)
+        stats = client.replicas[0].client.stats
+
+        def synced():
+            return stats()['replication']['lag'] is not None
+        self.wait(synced)
+        self.assertEqual('before sync', client.get('foo'))
+
+        client.set('foo', {'a': [1]})
+        client.set('bar', 1)
+        client.delete('bar')
+        self.wait(lambda: stats()['replication']['offset'] == 4)
+        replication = stats()['replication']
+        self.assertLess(replication['lag'], 0.5)
+        calls = stats()['commands']['GET']['calls']
+        self.assertEqual({'a': [1]}, client.get('foo'))
+        self.assertIsNone(client.get('bar'))
+        # both GETs were served by replica
+        self.assertEqual(calls + 2, stats()['commands']['GET']['calls'])
+
+        client.reset()
+        self.wait(lambda: stats()['keys'] == 0)
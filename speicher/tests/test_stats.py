@@ -0,0 +1,78 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+from .base import TestCase
+
+from ..stats import Histogram, ServerStats, format_metrics
+
+
+class HistogramTest(TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().percentile(50))
+
+    def test_percentile(self):
+        h = Histogram()
+        for i in range(1, 1001):
+            h.record(i * 1e-4)
+        self.assertEqual(1000, h.count)
+        self.assertAlmostEqual(0.05, h.percentile(50), delta=0.05 / 16)
+        self.assertAlmostEqual(0.099, h.percentile(99), delta=0.099 / 16)
+        self.assertEqual(0.1, h.percentile(100))
+
+    def test_tiny_values(self):
+        h = Histogram()
+        h.record(0)
+        h.record(1e-9)
+        self.assertEqual(1e-9, h.percentile(99))
+
+
+class ServerStatsTest(TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.stats = ServerStats(window=10.0, clock=lambda: self.now)
+
+    def test_snapshot(self):
+        self.stats.clients = 2
+        self.stats.bytes_in = 10
+        for _ in range(20):
+            self.stats.record('GET', 0.001)
+        self.stats.record('SET', 0.002)
+        self.stats.record_lag(0.005)
+        self.now += 10.0
+        self.stats.record('GET', 1.0)
+        result = self.stats.snapshot(keys=5)
+        self.assertEqual(10.0, result['uptime'])
+        self.assertEqual(2, result['clients'])
+        self.assertEqual(10, result['bytes_in'])
+        self.assertEqual(5, result['keys'])
+        get = result['commands']['GET']
+        self.assertEqual(21, get['calls'])
+        self.assertEqual(2.0, get['ops'])
+        self.assertAlmostEqual(0.001, get['p99'], delta=0.001 / 16)
+        self.assertEqual(0.002, result['commands']['SET']['p50'])
+        self.assertEqual(0.005, result['loop_lag']['max'])
+
+    def test_command_without_calls_in_window(self):
+        self.stats.record('SET', 0.002)
+        self.now += 25.0
+        self.stats.record('GET', 0.001)
+        self.now += 10.0
+        result = self.stats.snapshot()
+        self.assertEqual(1, result['commands']['SET']['calls'])
+        self.assertEqual(0, result['commands']['SET']['ops'])
+        self.assertIsNone(result['commands']['SET']['p50'])
+        self.assertEqual(0.1, result['commands']['GET']['ops'])
+
+    def test_format_metrics(self):
+        self.stats.record('GET', 0.001)
+        text = format_metrics(self.stats.snapshot(keys=1, memory=dict(keys=3)))
+        lines = text.splitlines()
+        self.assertIn('speicher_keys 1', lines)
+        self.assertIn('speicher_memory_bytes{kind="keys"} 3', lines)
+        self.assertIn('speicher_command_calls{command="GET"} 1', lines)
+        self.assertIn(
+            'speicher_command_seconds{command="GET",quantile="p50"} 0.001',
+            lines)
+        self.assertNotIn('loop_lag_seconds{quantile="p50"}', text)
@@ -0,0 +1,136 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+from .base import TestCase
+
+from ..storage import DictStorage, CompactStorage
+
+
+class StorageTestMixin(object):
+
+    storage_class = None
+
+    def setUp(self):
+        self.storage = self.storage_class()
+
+    def test_set_get(self):
+        self.assertIsNone(self.storage.get(b'foo'))
+        self.storage.set(b'foo', b'"bar"')
+        self.assertEqual(b'"bar"', self.storage.get(b'foo'))
+        self.assertEqual(1, len(self.storage))
+
+    def test_overwrite(self):
+        self.storage.set(b'foo', b'"bar"')
+        self.storage.set(b'foo', b'"baz"')
+        self.assertEqual(b'"baz"', self.storage.get(b'foo'))
+        self.storage.set(b'foo', b'[1, 2, 3]')
+        self.assertEqual(b'[1, 2, 3]', self.storage.get(b'foo'))
+        self.assertEqual(1, len(self.storage))
+
+    def test_delete(self):
+        self.assertFalse(self.storage.delete(b'foo'))
+        self.storage.set(b'foo', b'"bar"')
+        self.assertTrue(self.storage.delete(b'foo'))
+        self.assertIsNone(self.storage.get(b'foo'))
+        self.assertFalse(self.storage.delete(b'foo'))
+        self.assertEqual(0, len(self.storage))
+
+    def test_reset(self):
+        self.storage.set(b'foo', b'"bar"')
+        self.storage.reset()
+        self.assertIsNone(self.storage.get(b'foo'))
+        self.assertEqual(0, len(self.storage))
+
+    def test_many_keys(self):
+        data = dict((('key{0}'.format(i)).encode('ascii'),
+                     ('{0}'.format(i)).encode('ascii'))
+                    for i in range(1000))
+        for key, value in data.items():
+            self.storage.set(key, value)
+        for key in list(data)[::2]:
+            self.assertTrue(self.storage.delete(key))
+            del data[key]
+        self.assertEqual(data, dict(self.storage.items()))
+        for key, value in data.items():
+            self.assertEqual(value, self.storage.get(key))
+
+    def test_memory_usage(self):
+        self.storage.set(b'foo', b'"bar"')
+        usage = self.storage.memory_usage()
+        self.assertGreater(usage['keys'], 0)
+        self.assertGreater(usage['values'], 0)
+
+
+class DictStorageTest(StorageTestMixin, TestCase):
+
+    storage_class = DictStorage
+
+
+class CompactStorageTest(StorageTestMixin, TestCase):
+
+    storage_class = CompactStorage
+
+    def fill(self, count):
+        keys = [('key{0}'.format(i)).encode('ascii') for i in range(count)]
+        for key in keys:
+            self.storage.set(key, b'"' + key + b'"')
+        return keys
+
+    def test_compaction(self):
+        keys = self.fill(100)
+        self.assertFalse(self.storage.needs_compaction)
+        self.assertFalse(self.storage.compact_step())
+        for key in keys[:80]:
+            self.storage.delete(key)
+        self.assertTrue(self.storage.needs_compaction)
+        garbage = self.storage.memory_usage()['garbage']
+        self.assertGreater(garbage, 0)
+        # writes during compaction go to new arena
+        self.assertTrue(self.storage.compact_step(limit=10))
+        self.storage.set(b'foo', b'"bar"')
+        self.storage.set(keys[99], b'"changed"')
+        self.storage.delete(keys[98])
+        while self.storage.compact_step(limit=10):
+            pass
+        self.assertFalse(self.storage.needs_compaction)
+        self.assertEqual(0, len(self.storage._arenas[1 - self.storage._current]))
+        expected = dict((key, b'"' + key + b'"') for key in keys[80:98])
+        expected[b'foo'] = b'"bar"'
+        expected[keys[99]] = b'"changed"'
+        self.assertEqual(expected, dict(self.storage.items()))
+        self.assertEqual(len(expected), len(self.storage))
+
+    def test_resize_during_compaction(self):
+        keys = self.fill(50)
+        for key in keys:
+            self.storage.delete(key)
+        self.storage.set(b'foo', b'"bar"')
+        self.assertTrue(self.storage.compact_step(limit=1))
+        self.fill(200)
+        while self.storage.compact_step(limit=1):
+            pass
+        self.assertEqual(201, len(self.storage))
+        self.assertEqual(b'"bar"', self.storage.get(b'foo'))
+        self.assertEqual(0, self.storage.memory_usage()['garbage'])
+
+    def test_memory_usage_live_bytes(self):
+        self.storage.set(b'foo', b'"bar"')
+        self.storage.set(b'foo', b'"baz"')
+        self.storage.set(b'foo', b'[1, 2]')
+        self.storage.set(b'spam', b'1')
+        self.storage.delete(b'spam')
+        usage = self.storage.memory_usage()
+        self.assertEqual(3, usage['keys'])
+        self.assertEqual(6, usage['values'])
+        while self.storage.compact_step():
+            pass
+        self.assertEqual(3, self.storage.memory_usage()['keys'])
+        self.storage.reset()
+        usage = self.storage.memory_usage()
+        self.assertEqual((0, 0), (usage['keys'], usage['values']))
+
+    def test_reset_drops_arenas(self):
+        self.fill(100)
+        self.storage.reset()
+        self.assertEqual([], list(self.storage.items()))
+        self.assertEqual(0, sum(map(len, self.storage._arenas)))
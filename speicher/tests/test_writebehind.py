@@ -0,0 +1,58 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+
+import mock
+
+from .base import TestCase
+
+from ..exceptions import TimeoutError
+from ..writebehind import WriteBehindQueue, OVERFLOW_DROP_OLDEST
+
+
+class WriteBehindQueueTest(TestCase):
+
+    def create_queue(self, **kwargs):
+        options = dict(host='127.1.2.3', port=65434)
+        options.update(kwargs)
+        q = WriteBehindQueue(**options)
+        self.addCleanup(q.close)
+        return q
+
+    def test_wrong_options(self):
+        with self.assertRaises(ValueError):
+            WriteBehindQueue(maxsize=0)
+        with self.assertRaises(ValueError):
+            WriteBehindQueue(overflow='unknown')
+
+    def test_drop_oldest(self):
+        q = self.create_queue(maxsize=2, overflow=OVERFLOW_DROP_OLDEST)
+        with mock.patch.object(q, '_start'):
+            for key in (b'a', b'b', b'c'):
+                q.put(b'DEL', key=key)
+        self.assertEqual(2, len(q))
+        self.assertEqual(1, q.dropped)
+        self.assertEqual([b'b', b'c'], [d['key'] for d in q._queue])
+
+    def test_connection_error(self):
+        q = self.create_queue()
+        q.put(b'SET', key=b'foo', value='bar')
+        q.put(b'DEL', key=b'foo')
+        q.close()
+        self.assertEqual(0, q.sent)
+        self.assertEqual(2, q.errors)
+        self.assertEqual(0, len(q))
+
+    def test_closed(self):
+        q = self.create_queue()
+        q.close()
+        with self.assertRaises(ValueError):
+            q.put(b'DEL', key=b'foo')
+
+    def test_flush_timeout(self):
+        q = self.create_queue()
+        with mock.patch.object(q, '_start'):
+            q.put(b'DEL', key=b'foo')
+        with self.assertRaises(TimeoutError):
+            q.flush(time.time() + 0.05)
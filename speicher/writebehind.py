@@ -0,0 +1,155 @@
+# coding: utf-8
+"""Background write-behind queue implementation."""
+from __future__ import absolute_import, unicode_literals, print_function
+
+from collections import deque
+from threading import Condition, Thread
+
+from .connection import Connection, remaining
+
+#: Block caller until queue has free space.
+OVERFLOW_BLOCK = 'block'
+
+#: Discard the oldest queued write to make room for a new one.
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+
+#: How many writes should be sent to server at once?
+MAX_BATCH_SIZE = 100
+
+
+class WriteBehindQueue(object):
+    """Bounded queue that streams writes to the server from background
+    thread using its own connection. Writes are sent with ``noreply`` flag,
+    so results of them are unknown, only counters are kept:
+
+    - ``sent`` - how many writes was written to socket;
+    - ``dropped`` - how many writes was discarded because queue was full;
+    - ``errors`` - how many writes was lost due to connection or encoding errors.
+
+    """
+
+    def __init__(self, host=None, port=None, timeout=None,
+                 maxsize=1000, overflow=OVERFLOW_BLOCK, connect_timeout=None,
+                 nodelay=True, keepalive=None):
+        if maxsize <= 0:
+            raise ValueError('Queue size should be positive integer.')
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST):
+            raise ValueError('Unknown overflow policy {0!r}.'.format(overflow))
+        self._conn = Connection(host, port, timeout, connect_timeout,
+                                nodelay, keepalive)
+        self._queue = deque()
+        self._cond = Condition()
+        self._thread = None
+        self._in_flight = 0
+        self._executing = False
+        self._closed = False
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _start(self):
+        """Start background thread if it not started yet."""
+        if self._thread is not None:
+            return
+        thread = self._thread = Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def put(self, command, **kwargs):
+        """Enqueue given command, return immediately unless queue is full
+        and overflow policy is blocking.
+
+        """
+        data = dict(command=command, noreply=True, **kwargs)
+        with self._cond:
+            if self._closed:
+                raise ValueError('Queue is closed.')
+            self._start()
+            while len(self._queue) >= self.maxsize:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._cond.wait()
+            self._queue.append(data)
+            self._cond.notify_all()
+
+    def _take(self):
+        """Wait for queued writes and take batch of them."""
+        with self._cond:
+            # connection is used by :meth:`execute`, so writes should wait
+            while self._executing or not (self._queue or self._closed):
+                self._cond.wait()
+            batch = []
+            while self._queue and len(batch) < MAX_BATCH_SIZE:
+                batch.append(self._queue.popleft())
+            self._in_flight = len(batch)
+            self._cond.notify_all()
+            return batch
+
+    def _done(self, sent, failed):
+        with self._cond:
+            self.sent += sent
+            self.errors += failed
+            self._in_flight = 0
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                break
+            try:
+                self._conn.send_many(batch)
+            except Exception:  # batch is lost on any error
+                self._done(0, len(batch))
+            else:
+                self._done(len(batch), 0)
+        self._conn.disconnect()
+
+    def execute(self, command, deadline=None, **kwargs):
+        """Send command with reply over connection of queue after all queued
+        writes and return reply, so server applies command after them.
+
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError('Queue is closed.')
+            while self._queue or self._in_flight or self._executing:
+                self._cond.wait(remaining(deadline, self._conn.timeout))
+            self._executing = True
+        # lock isn't held, so writes can be queued meanwhile
+        try:
+            self._conn.send(dict(command=command, **kwargs), deadline)
+            return self._conn.read(deadline)
+        finally:
+            with self._cond:
+                self._executing = False
+                self._cond.notify_all()
+
+    def flush(self, deadline=None):
+        """Wait until all queued writes are written to socket, raise
+        :class:`~speicher.exceptions.TimeoutError` if ``deadline`` (absolute
+        time) passes earlier.
+
+        """
+        with self._cond:
+            while self._queue or self._in_flight:
+                self._cond.wait(remaining(deadline, self._conn.timeout))
+
+    def close(self):
+        """Drain queue, stop background thread and close connection."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self._conn.disconnect()
@@ -2,9 +2,10 @@
 from __future__ import absolute_import, unicode_literals, print_function
 
 import os
+import time
 from unittest import TestCase
 
-from speicher import Speicher, exceptions
+from speicher import Speicher, RawValue, exceptions
 
 
 class SpeicherTest(TestCase):
@@ -26,6 +27,10 @@ class SpeicherTest(TestCase):
         self.client.set(b'foo', ['b', 'a', 'r'])
         self.assertEqual(['b', 'a', 'r'], self.client.get(b'foo'))
 
+    def test_set_raw(self):
+        self.client.set(b'foo', RawValue(b'{"b": ["a", "r"]}'))
+        self.assertEqual({'b': ['a', 'r']}, self.client.get(b'foo'))
+
     def test_set_none(self):
         self.assertIsNone(self.client.get(b'foo'))
         self.client.set(b'foo', None)
@@ -37,12 +42,52 @@ class SpeicherTest(TestCase):
         self.assertTrue(self.client.delete(b'foo'))
         self.assertIsNone(self.client.get(b'foo'))
 
+    def test_noreply(self):
+        self.assertIsNone(self.client.set(b'foo', 'bar', noreply=True))
+        self.assertEqual('bar', self.client.get(b'foo'))
+        self.assertIsNone(self.client.delete(b'foo', noreply=True))
+        self.assertIsNone(self.client.get(b'foo'))
+
+    def test_write_behind(self):
+        client = Speicher(host=self.client._conn.host,
+                          port=self.client._conn.port, write_behind=True)
+        self.addCleanup(client.close)
+        client.set(b'foo', 'bar')
+        client.close()
+        self.assertEqual(1, client.write_queue.sent)
+        # write goes over other connection, so it may be applied a bit later
+        deadline = time.time() + 1.0
+        while self.client.get(b'foo') is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual('bar', self.client.get(b'foo'))
+
     def test_reset(self):
         self.client.set(b'foo', 'bar')
         self.assertEqual('bar', self.client.get(b'foo'))
         self.client.reset()
         self.assertIsNone(self.client.get(b'foo'))
 
+    def test_dump_restore(self):
+        data = dict(('key{0}'.format(i), [i]) for i in range(25))
+        self.assertEqual(25, self.client.restore(data.items(), batch_size=10))
+        self.assertEqual([5], self.client.get(b'key5'))
+        self.assertEqual(data, dict(self.client.dump(batch_size=10)))
+        self.client.reset()
+        self.assertEqual([], list(self.client.dump()))
+
+    def test_stats(self):
+        self.client.set(b'foo', 'bar')
+        self.client.get(b'foo')
+        stats = self.client.stats()
+        self.assertEqual(1, stats['keys'])
+        self.assertGreaterEqual(stats['clients'], 1)
+        self.assertGreater(stats['bytes_in'], 0)
+        self.assertGreater(stats['bytes_out'], 0)
+        self.assertGreaterEqual(stats['commands']['GET']['calls'], 1)
+        for name in ('keys', 'values'):
+            self.assertIn(name, stats['memory'])
+        self.assertIn('p99', stats['loop_lag'])
+
     def test_wrong_command(self):
         with self.assertRaises(exceptions.ClientError):
             self.client._execute(b'UNKNOWN')